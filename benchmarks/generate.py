@@ -0,0 +1,97 @@
+"""
+Generator of synthetic Plogbooks for benchmarks.
+Plogs are rendered with the default templates and have their sources saved next to them like written ones, their
+creation times are spread over the past years.
+
+usage: python benchmarks/generate.py LOCATION [--categories N] [--plogs M] [--msg_size CHARS]
+"""
+from __future__ import print_function
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from plogbook.book import PlogBook
+from plogbook.plog import write_source, source_digest
+
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore et dolore '
+         'magna aliqua enim ad minim veniam quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo '
+         'consequat duis aute irure in reprehenderit voluptate velit esse cillum eu fugiat nulla pariatur').split()
+YEAR = 365 * 24 * 3600
+
+
+def message(rng, size, images=()):
+    """
+    :param rng: random.Random
+    :param size: approximate length of the message in characters
+    :param images: urls of images to reference in the message
+    :return: message of random words split into lines
+    """
+    lines = []
+    length = 0
+    while length < size:
+        line = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(5, 40)))
+        length += len(line) + 1
+        lines.append(line)
+    for url in images:
+        lines.insert(rng.randint(0, len(lines)), '<img src="{}">'.format(url))
+    return '\n'.join(lines)
+
+
+def message_size(rng, median):
+    """Message sizes are log-normally distributed, most plogs are short and a few are very long"""
+    return max(1, int(rng.lognormvariate(0, 1) * median))
+
+
+def generate(location, categories=10, plogs=100, msg_size=500, years=3, seed=0):
+    """
+    Writes a synthetic Plogbook
+    :param location: directory of the Plogbook, created if it doesn't exist
+    :param categories: number of categories
+    :param plogs: number of plogs in every category
+    :param msg_size: median message size in characters
+    :param years: plogs are created over this many past years
+    :param seed: seed of the random generator, same arguments generate the same Plogbook
+    :return: PlogBook of the generated Plogbook
+    """
+    rng = random.Random(seed)
+    book = PlogBook(location)
+    now = time.time()
+    for cat_number in range(categories):
+        category = 'category {}'.format(cat_number)
+        directory = os.path.join(location, category)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        book.mark_category(directory)
+        for plog_number in range(plogs):
+            title = 'plog {} {}'.format(cat_number, plog_number)
+            created = now - rng.random() * years * YEAR
+            date = time.strftime('%x-%X', time.localtime(created))
+            msg = message(rng, message_size(rng, msg_size))
+            html = book.make_log_html(msg=msg, cat=category, title=title, date=date, created=created,
+                                      source=source_digest(msg))
+            plog_location = os.path.join(directory, title + '.html')
+            with open(plog_location, 'w') as html_file:
+                html_file.write(html)
+            write_source(plog_location, msg, category=category, title=title, date=date, created=created)
+            os.utime(plog_location, (created, created))
+    book.ensure_theme()
+    return book
+
+
+def main():
+    parser = argparse.ArgumentParser(description='generates synthetic Plogbook for benchmarks')
+    parser.add_argument('location', help='directory of the Plogbook')
+    parser.add_argument('--categories', type=int, default=10, help='number of categories, default 10')
+    parser.add_argument('--plogs', type=int, default=100, help='number of plogs per category, default 100')
+    parser.add_argument('--msg_size', type=int, default=500, help='median message size in characters, default 500')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random generator')
+    args = parser.parse_args()
+    generate(args.location, args.categories, args.plogs, args.msg_size, seed=args.seed)
+    print('generated {} categories with {} plogs each in {}'.format(args.categories, args.plogs, args.location))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""
+Benchmark suite of the Plogbook operations that scale with the size of the Plogbook.
+A synthetic Plogbook is generated in a temporary directory, every benchmark is timed --repeat times and the results
+are written as JSON so they can be compared across commits.
+
+usage: python benchmarks/run.py [--categories N] [--plogs M] [--msg_size CHARS] [--repeat R]
+                                [--output results.json] [--compare previous.json]
+"""
+from __future__ import print_function
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import tempfile
+import argparse
+import threading
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from plogbook.book import PlogBook
+from plogbook.index import INDEX_DIR
+from generate import generate, message
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+
+IMAGE = b'\x89PNG\r\n\x1a\n' + b'\x00' * 16 * 1024
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    """Serves the same fake image for every path"""
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(IMAGE)))
+        self.end_headers()
+        self.wfile.write(IMAGE)
+
+    def log_message(self, *args):
+        pass
+
+
+class ImageServer(ThreadingMixIn, HTTPServer):
+    """Local stand-in for image hosts, threaded so concurrent downloads aren't queued behind each other"""
+    daemon_threads = True
+
+
+class Quiet:
+    """Silences stdout and optionally feeds stdin, for the commands that print or ask for input"""
+
+    def __init__(self, stdin=None):
+        self.stdin = stdin
+
+    def __enter__(self):
+        self.saved = sys.stdout, sys.stdin
+        sys.stdout = open(os.devnull, 'w')
+        if self.stdin is not None:
+            sys.stdin = io.StringIO(self.stdin)
+
+    def __exit__(self, *exc):
+        sys.stdout.close()
+        sys.stdout, sys.stdin = self.saved
+
+
+def remove_index(location):
+    path = os.path.join(location, INDEX_DIR, 'index.db')
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def benchmarks(location, args):
+    """
+    :return: list of (name, setup, run) of the benchmarks, setup is called before every timed run
+    """
+    largest = os.path.join(location, 'category 0')
+
+    def unindexed():
+        remove_index(location)
+
+    def indexed():
+        PlogBook(location).index.db
+
+    def cat_html(book):
+        return lambda: book.make_cat_html(largest)
+
+    rng = random.Random(1)
+    titles = iter(range(10 ** 9))
+
+    def write_plog(book):
+        def run():
+            msg = message(rng, args.msg_size)
+            with Quiet(stdin=u'category 0\nwritten {}\n{}'.format(next(titles), msg)):
+                book.write_plog()
+        return run
+
+    server = ImageServer(('127.0.0.1', 0), ImageHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    images = ['http://127.0.0.1:{}/image{}.png'.format(server.server_port, n) for n in range(args.images)]
+    html = message(random.Random(0), args.msg_size, images)
+    convert_directory = tempfile.mkdtemp()
+
+    def clear_images():
+        shutil.rmtree(convert_directory)
+        os.makedirs(convert_directory)
+
+    def convert_html():
+        PlogBook.convert_html(html, convert_directory, localize_img=True,
+                              cache_directory=os.path.join(convert_directory, 'cache'))
+
+    scan, warm = PlogBook(location), PlogBook(location)
+    return [
+        ('find_plogs (scan)', unindexed, lambda: scan.find_plogs(silent=True)),
+        ('find_categories (scan)', unindexed, lambda: scan.find_categories(silent=True)),
+        ('make_main_html (scan)', unindexed, lambda: scan.make_main_html()),
+        ('make_cat_html (scan)', unindexed, cat_html(scan)),
+        ('reindex (full)', unindexed, lambda: PlogBook(location).index.db),
+        ('find_plogs (indexed)', indexed, lambda: warm.find_plogs(silent=True)),
+        ('find_categories (indexed)', indexed, lambda: warm.find_categories(silent=True)),
+        ('make_main_html (indexed)', indexed, lambda: warm.make_main_html()),
+        ('make_cat_html (indexed)', indexed, cat_html(warm)),
+        ('write_plog', indexed, write_plog(warm)),
+        ('convert_html ({} images)'.format(args.images), clear_images, convert_html),
+    ], lambda: (server.shutdown(), server.server_close(), shutil.rmtree(convert_directory))
+
+
+def measure(setup, run, repeat):
+    """
+    :return: list of seconds each run took
+    """
+    times = []
+    for _ in range(repeat):
+        setup()
+        start = time.time()
+        run()
+        times.append(time.time() - start)
+    return times
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], universal_newlines=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, previous):
+    """Prints median change of every benchmark that is in both results"""
+    print('\ncompared to {}:'.format(previous.get('commit')))
+    for name, result in sorted(results['benchmarks'].items()):
+        old = previous['benchmarks'].get(name)
+        if old:
+            change = (result['median'] - old['median']) / old['median'] * 100 if old['median'] else 0
+            print('  {:<32} {:>9.2f}ms -> {:>9.2f}ms {:>+7.1f}%'.format(name, old['median'] * 1000,
+                                                                         result['median'] * 1000, change))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Plogbook benchmark suite')
+    parser.add_argument('--categories', type=int, default=10, help='number of categories, default 10')
+    parser.add_argument('--plogs', type=int, default=200, help='number of plogs per category, default 200')
+    parser.add_argument('--msg_size', type=int, default=500, help='median message size in characters, default 500')
+    parser.add_argument('--images', type=int, default=20, help='number of images to localize, default 20')
+    parser.add_argument('--repeat', type=int, default=5, help='number of timed runs of every benchmark, default 5')
+    parser.add_argument('--only', help='run only benchmarks whose name contains this')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of a previous run to compare with')
+    args = parser.parse_args()
+
+    location = tempfile.mkdtemp(prefix='plogbook-bench-')
+    try:
+        start = time.time()
+        generate(location, args.categories, args.plogs, args.msg_size)
+        print('generated {} plogs in {:.1f}s'.format(args.categories * args.plogs, time.time() - start))
+        suite, cleanup = benchmarks(location, args)
+        results = {'commit': git_commit(), 'python': platform.python_version(), 'time': time.time(),
+                   'params': {'categories': args.categories, 'plogs': args.plogs, 'msg_size': args.msg_size,
+                              'images': args.images, 'repeat': args.repeat},
+                   'benchmarks': {}}
+        try:
+            for name, setup, run in suite:
+                if args.only and args.only not in name:
+                    continue
+                times = sorted(measure(setup, run, args.repeat))
+                results['benchmarks'][name] = {'min': times[0], 'median': times[len(times) // 2],
+                                               'max': times[-1], 'times': times}
+                print('{:<32} median {:>9.2f}ms  min {:>9.2f}ms'.format(name, times[len(times) // 2] * 1000,
+                                                                          times[0] * 1000))
+        finally:
+            cleanup()
+    finally:
+        shutil.rmtree(location)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as previous_file:
+            compare(results, json.load(previous_file))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Startup time benchmark of the plogbook command line.
+Imports plogbook.argparser in fresh interpreters with -X importtime (python 3.7+) and fails when the median
+cumulative import time goes over the budget or when a module that should be deferred is loaded at startup.
+
+usage: python benchmarks/startup.py [--budget MS] [--runs N] [--top N]
+"""
+from __future__ import print_function
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY = 'plogbook.argparser'
+# heavy modules that only some commands need, they must not be imported at startup
+DEFERRED = ['markdown2', 'subprocess', 'tempfile', 'webbrowser', 'sqlite3', 'urllib.request', 'urllib.parse',
+            'hashlib', 'multiprocessing', 'plogbook.search', 'plogbook.images', 'plogbook.rebuild']
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+
+def import_times():
+    """
+    Imports the entry module in a fresh interpreter
+    :return: ({module: (self us, cumulative us)}, list of loaded modules)
+    """
+    code = 'import sys, {}; print(" ".join(sys.modules))'.format(ENTRY)
+    process = subprocess.Popen([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    out, err = process.communicate()
+    if process.returncode:
+        raise RuntimeError(err)
+    times = {}
+    for line in err.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            times[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return times, out.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='plogbook startup time benchmark')
+    parser.add_argument('--budget', type=float, default=50, help='max median import time in ms, default 50')
+    parser.add_argument('--runs', type=int, default=7, help='number of fresh interpreters to measure, default 7')
+    parser.add_argument('--top', type=int, default=10, help='number of slowest modules to show, default 10')
+    args = parser.parse_args()
+    if sys.version_info < (3, 7):
+        print('-X importtime needs python 3.7+')
+        return 2
+
+    runs = [import_times() for _ in range(args.runs)]
+    totals = sorted(times[ENTRY][1] / 1000.0 for times, _ in runs)
+    median = totals[len(totals) // 2]
+    times, modules = runs[-1]
+    print('{} import: median {:.1f}ms, min {:.1f}ms, max {:.1f}ms over {} runs (budget {:.0f}ms)'.format(
+        ENTRY, median, totals[0], totals[-1], len(totals), args.budget))
+    print('slowest modules (self time):')
+    for name, (self_time, cumulative) in sorted(times.items(), key=lambda item: -item[1][0])[:args.top]:
+        print('  {:>8.2f}ms {:>8.2f}ms  {}'.format(self_time / 1000.0, cumulative / 1000.0, name))
+
+    failed = False
+    loaded = [name for name in DEFERRED if name in modules]
+    if loaded:
+        print('FAIL: modules that should be deferred are imported at startup: {}'.format(', '.join(loaded)))
+        failed = True
+    if median > args.budget:
+        print('FAIL: startup is over budget by {:.1f}ms'.format(median - args.budget))
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,367 @@
+"""
+Packed storage of old plogs.
+--archive moves plogs of a category into <category>/.archive.pack, an append only file of plog html and sources, and
+records where every plog is in <category>/.archive.index so a category of thousands of plogs is a handful of files.
+Archived plogs keep their place in listings under <category>/.archive.pack/<title> locations and are read from the
+pack with memory mapped random access. For browsing without --serve they are also written to static
+<category>/archive-<n>.html pages of PAGE_SIZE plogs each, pages link them as archive-<n>.html#<title>.
+"""
+from __future__ import print_function
+import os
+import re
+import json
+from datetime import datetime
+
+from plogbook import utils
+from plogbook.plog import source_location, plog_created, HEADER_PREFIX
+
+PACK_FILE = '.archive.pack'
+INDEX_FILE = '.archive.index'
+PAGE_SIZE = 50  # archived plogs per static archive page, numbered from the oldest so pages only grow at the end
+PLOG_HEAD = re.compile(r'<head>.*?</head>', re.S | re.I)
+PLOG_ID = re.compile(r'\sid=([\'"]).*?\1')
+
+# open archives of this process by category location
+_archives = {}
+
+
+class Entry(object):
+    """Position of an archived plog in the pack"""
+    __slots__ = ('title', 'created', 'mtime', 'html', 'source')
+
+    def __init__(self, title, created, mtime, html, source=None):
+        """
+        :param html: (offset, length) of the plog html in the pack
+        :param source: (offset, length) of the plog source in the pack or None if plog has no source
+        """
+        self.title = title
+        self.created = created
+        self.mtime = mtime
+        self.html = tuple(html)
+        self.source = tuple(source) if source else None
+
+
+class Archive:
+    """
+    Pack of archived plogs of a category.
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: location of the category
+        """
+        self.directory = directory
+        self.pack_location = os.path.join(directory, PACK_FILE)
+        self.index_location = os.path.join(directory, INDEX_FILE)
+        self._entries = None
+        self._version = None
+        self._titles = None
+        self._positions = None
+        self._file = None
+        self._map = None
+
+    def _index_version(self):
+        try:
+            stat = os.stat(self.index_location)
+        except OSError:
+            return None
+        return stat.st_mtime, stat.st_size
+
+    @property
+    def entries(self):
+        """dict of archived plogs by title, later entries of a plog replace the earlier ones"""
+        version = self._index_version()
+        if self._entries is None or version != self._version:
+            entries = {}
+            if version is not None:
+                with open(self.index_location) as index_file:
+                    for line in index_file:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:  # line cut short by a crash
+                            continue
+                        entries[record['title']] = Entry(**record)
+            self._entries = entries
+            self._version = version
+            self._titles = self._positions = None
+        return self._entries
+
+    @property
+    def titles(self):
+        """titles of archived plogs ordered from the oldest, the order of the static archive pages"""
+        entries = self.entries
+        if self._titles is None:
+            self._titles = sorted(entries, key=lambda title: (entries[title].created, title))
+        return self._titles
+
+    @property
+    def positions(self):
+        """dict of positions of archived plogs in titles by their title"""
+        titles = self.titles
+        if self._positions is None:
+            self._positions = dict((title, position) for position, title in enumerate(titles))
+        return self._positions
+
+    def href(self, title):
+        """:return: url of archived plog on the static archive pages, relative to the category"""
+        return '{}#{}'.format(utils.quote(page_name(self.positions[title] // PAGE_SIZE + 1)), utils.quote(title))
+
+    def write_pages(self, book):
+        """
+        Writes archived plogs to the static archive-<n>.html pages of the category, only changed pages are written.
+        A page is the plog template rendered once with the messages of it's plogs, every plog anchored by it's title.
+        :param book: PlogBook the category belongs to
+        :return: number of changed files
+        """
+        titles = self.titles
+        template = book.get_template('plog.html')
+        theme = book.theme_href(self.directory)
+        category = os.path.basename(self.directory)
+        changed = 0
+        for start in range(0, len(titles), PAGE_SIZE):
+            page = titles[start:start + PAGE_SIZE]
+            dates = [format_date(self.entries[title].created) for title in (page[0], page[-1])]
+            head, tail = template.split('msg', cat=category, title=page_name(start // PAGE_SIZE + 1)[:-len('.html')],
+                                        date=' - '.join(sorted(set(dates), key=dates.index)), theme=theme)
+            parts = [head]
+            for title in page:
+                self._write_plog(parts.append, book, title)
+            parts.append(tail)
+            changed += utils.write_file(os.path.join(self.directory, page_name(start // PAGE_SIZE + 1)), ''.join(parts))
+        number = -(-len(titles) // PAGE_SIZE) + 1
+        while os.path.exists(os.path.join(self.directory, page_name(number))):
+            os.remove(os.path.join(self.directory, page_name(number)))
+            number += 1
+        return changed
+
+    def _write_plog(self, write, book, title):
+        """
+        Writes archived plog as a section of an archive page, the message is rendered from the source when the plog
+        has it, otherwise it's html is taken without it's header, head and ids so they aren't repeated on the page
+        """
+        from xml.sax.saxutils import escape, quoteattr
+        from plogbook.plog import open_source
+        write("<div id={} class='archived_plog'>\n<h3>{}</h3>\n<p class='archived_date'>{}</p>\n".format(
+            quoteattr(title), escape(title.replace('.html', '')), format_date(self.entries[title].created)))
+        source = open_source(self.location(title))
+        if source is not None:
+            book.write_plog_message(write, self.location(title), source)
+        else:
+            html = self.read(title)
+            if html.startswith(HEADER_PREFIX):
+                html = html.partition('\n')[2]
+            write(PLOG_ID.sub('', PLOG_HEAD.sub('', html)))
+        write('\n</div>\n')
+
+    def location(self, title):
+        """:return: location archived plog is listed under"""
+        return os.path.join(self.pack_location, title)
+
+    def _read(self, span):
+        """Reads span of the pack through a memory map that is remapped when the pack grows"""
+        offset, length = span
+        if self._map is None or len(self._map) < offset + length:
+            import mmap
+            self.close()
+            self._file = open(self.pack_location, 'rb')
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map[offset:offset + length].decode('utf-8')
+
+    def read(self, title, source=False):
+        """
+        :param title: file name of the plog, i.e. first.html
+        :param source: read the plog source instead of the html
+        :return: html or source of the plog or None if it's not archived
+        """
+        entry = self.entries.get(title)
+        if entry is None or (source and entry.source is None):
+            return None
+        return self._read(entry.source if source else entry.html)
+
+    def _append(self, record, **parts):
+        """
+        Appends parts to the pack and then records them in the index, so the index never points past the pack
+        :param record: index record of the plog, spans of the parts are added to it
+        :param parts: bytes to append by their name in the record, i.e. html
+        """
+        with open(self.pack_location, 'ab') as pack:
+            pack.seek(0, os.SEEK_END)
+            for name, part in sorted(parts.items()):
+                record[name] = (pack.tell(), len(part))
+                pack.write(part)
+            pack.flush()
+            os.fsync(pack.fileno())
+        with open(self.index_location, 'a') as index_file:
+            index_file.write(json.dumps(record) + '\n')
+            index_file.flush()
+            os.fsync(index_file.fileno())
+
+    def add(self, location, created=None):
+        """
+        Moves plog and it's source into the pack
+        :param location: location of the plog .html file
+        :param created: creation timestamp of the plog, defaults to the one in it's header
+        """
+        parts = {}
+        with open(location, 'rb') as html_file:
+            parts['html'] = html_file.read()
+        if os.path.exists(source_location(location)):
+            with open(source_location(location), 'rb') as source_file:
+                parts['source'] = source_file.read()
+        created = plog_created(location) if created is None else created
+        self._append({'title': os.path.basename(location), 'created': created, 'mtime': os.stat(location).st_mtime},
+                     **parts)
+        if 'source' in parts:
+            os.remove(source_location(location))
+        os.remove(location)
+
+    def replace(self, title, html):
+        """
+        Appends new html of an archived plog, it's source stays where it is
+        :return: whether the html changed
+        """
+        entry = self.entries[title]
+        html = html.encode('utf-8')
+        if len(html) == entry.html[1] and self._read(entry.html).encode('utf-8') == html:
+            return False
+        self._append({'title': title, 'created': entry.created, 'mtime': entry.mtime, 'source': entry.source},
+                     html=html)
+        return True
+
+    def plogs(self, exclude=()):
+        """
+        :param exclude: titles of plogs that also exist as files, files take precedence
+        :return: list of (location, title, created, mtime) tuples of archived plogs
+        """
+        return [(self.location(title), title, entry.created, entry.mtime)
+                for title, entry in sorted(self.entries.items()) if title not in exclude]
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = self._file = None
+
+
+def format_date(created):
+    """Date of an archived plog the way plogs show it"""
+    return datetime.fromtimestamp(created).strftime('%x-%X')
+
+
+def page_name(number):
+    """File name of a static archive page"""
+    return 'archive-{}.html'.format(number)
+
+
+def get_archive(directory):
+    """
+    :param directory: location of a category
+    :return: Archive of the category or None if it has no archived plogs
+    """
+    directory = os.path.abspath(directory)
+    archive = _archives.get(directory)
+    if archive is None:
+        if not os.path.exists(os.path.join(directory, INDEX_FILE)):
+            return None
+        archive = _archives[directory] = Archive(directory)
+    return archive
+
+
+def split_location(location):
+    """
+    :param location: location of a plog
+    :return: (category location, title) if plog is archived otherwise None
+    """
+    pack, title = os.path.split(location)
+    if os.path.basename(pack) != PACK_FILE:
+        return None
+    return os.path.dirname(pack), title
+
+
+def read(location, source=False):
+    """
+    :param location: location of an archived plog, see Archive.location
+    :param source: read the plog source instead of the html
+    :return: html or source of the plog or None if it's not archived
+    """
+    split = split_location(location)
+    archive = split and get_archive(split[0])
+    if not archive:
+        return None
+    return archive.read(split[1], source=source)
+
+
+def static_href(location):
+    """
+    :param location: location of a plog
+    :return: url of an archived plog on the static archive pages relative to it's category, None if it's not archived
+    """
+    split = split_location(location)
+    archive = split and get_archive(split[0])
+    if not archive or split[1] not in archive.entries:
+        return None
+    return archive.href(split[1])
+
+
+def archived_plogs(directory, exclude=()):
+    """
+    :param directory: location of a category
+    :param exclude: titles of plogs that exist as files
+    :return: list of (location, title, created, mtime) tuples of archived plogs of the category
+    """
+    archive = get_archive(directory)
+    return archive.plogs(exclude) if archive else []
+
+
+def archive_plogs(book, before, categories=None):
+    """
+    Moves plogs created before a date into the packs of their categories and updates the category pages
+    :param book: PlogBook to archive plogs of
+    :param before: timestamp, plogs created before it are archived
+    :param categories: names of categories to archive plogs of, None for all
+    :return: number of archived plogs
+    """
+    total = 0
+    for category in book.find_categories(silent=True, categories=categories):
+        plogs = [plog for plog in book.find_plogs(category.location, recursive=False, silent=True, until=before)
+                 if split_location(plog.location) is None and plog.created < before]
+        if not plogs:
+            continue
+        archive = get_archive(category.location) or Archive(category.location)
+        for plog in plogs:
+            archive.add(plog.location, plog.created)
+        _archives[os.path.abspath(category.location)] = archive
+        archive.write_pages(book)
+        if book.index.exists():
+            book.index.reindex(rescan=[category.name])
+        book.write_cat_html(category.location)
+        print('{}: {} plogs archived'.format(category.name, len(plogs)))
+        total += len(plogs)
+    if total:
+        book.write_main_html()
+        book.write_date_pages()
+        book.write_feed()
+    return total
+
+
+def rebuild_archived(book, directory):
+    """
+    Re-renders archived plogs of a category that have their source, new html is appended to the pack
+    :return: number of rebuilt plogs
+    """
+    from plogbook.plog import open_source
+    archive = get_archive(directory)
+    if archive is None:
+        return 0
+    rebuilt = 0
+    for title, entry in sorted(archive.entries.items()):
+        location = archive.location(title)
+        source = open_source(location)
+        if source is None:
+            continue
+        parts = []
+        book.write_plog_html(parts.append, location, source)
+        archive.replace(title, ''.join(parts))
+        rebuilt += 1
+    archive.write_pages(book)
+    return rebuilt
@@ -1,7 +1,6 @@
 import argparse
 import os
 import sys
-import webbrowser
 
 # # multi-versioning
 VERSION = sys.version_info[0]
@@ -10,7 +9,8 @@ if IS_3:
     input = input
 else:
     input = raw_input
-from plogbook.book import PlogBook, MARKDOWN
+from plogbook.book import PlogBook
+from plogbook.utils import parse_date
 
 
 def run_argparse():
@@ -29,14 +29,50 @@ def run_argparse():
     parser.add_argument('--find', help='finds plogs in the current directory', action='store_true')
     parser.add_argument('--find_categories', help='finds all categories in a Plogbook', action='store_true')
     parser.add_argument('--findr', help='finds plogs in the current directory recursively', action='store_true')
+    parser.add_argument('--search', '-s', help='finds plogs containing the given terms, best matches first')
+    parser.add_argument('--category', '-c', help='only plogs of this category, i.e. with --search or --find, can be '
+                                                 'repeated', action='append')
+    parser.add_argument('--since', help='only plogs created since date YYYY-MM-DD["HH:MM"], i.e. with --search or '
+                                        '--find', type=parse_date)
+    parser.add_argument('--until', help='only plogs created until date YYYY-MM-DD["HH:MM"], i.e. with --search or '
+                                        '--find', type=parse_date)
+    parser.add_argument('--limit', help='max number of results, i.e. with --search or --find', type=int)
+    parser.add_argument('--sort', help='sort --find, --findr results by date, title, category or location and '
+                                       '--find_categories results by name, count or date, add :desc for '
+                                       'descending order, i.e. date:desc')
+    parser.add_argument('--format', help='output format of --find, --findr and --find_categories',
+                        choices=['text', 'jsonl', 'csv', 'tsv'], default='text')
     parser.add_argument('--pretty', '-p', help='prettifies output of console output i.e. --find and --findr',
                         action='store_true')
     parser.add_argument('--override_theme', '-ot', help='override theme with new one', action='store_true')
 
     parser.add_argument('--rebuild_main', '-rbm', help='rebuild main Plogbook page', action='store_true')
     parser.add_argument('--rebuild_main_theme', '-rbt', help='rebuild main Plogbook page theme', action='store_true')
+    parser.add_argument('--rebuild_dates', '-rbd', help='rebuild date pages in <Plogbook>/dates and the Atom feed '
+                                                       'feed.atom', action='store_true')
     parser.add_argument('--rebuild_cat_main', '-rbcm', help='rebuild category main')
     parser.add_argument('--rebuild_cat_theme', '-rbct', help='rebuild category theme')
+    parser.add_argument('--rebuild_all', '-rba', help='rebuild every plog, category page and main page with the '
+                                                     'current templates', action='store_true')
+    parser.add_argument('--jobs', '-j', help='number of processes to use for --rebuild_all and --import, defaults '
+                                              'to cpu count, or threads scanning categories with --find_categories',
+                        type=int)
+    parser.add_argument('--page_size', help='number of plogs/categories per page, remembered for the Plogbook, '
+                                            'rebuild pages to apply it', type=int)
+    parser.add_argument('--reindex', help='reconcile Plogbook index in <Plogbook>/.plogbook with the files',
+                        action='store_true')
+    parser.add_argument('--archive', help='move plogs created before --before date into an append only pack file of '
+                                          'their category, only plogs of --category when given', action='store_true')
+    parser.add_argument('--before', help='date YYYY-MM-DD["HH:MM"] plogs are archived before, see --archive',
+                        type=parse_date)
+    parser.add_argument('--import', dest='import_from', help='import notes from a folder of .txt/.md files (sub folders '
+                                                            'become categories) or from a .jsonl file with category, '
+                                                            'title and msg keys')
+    parser.add_argument('--watch', help='keep watching the Plogbook and update pages and themes when plogs or '
+                                        'templates change', action='store_true')
+    parser.add_argument('--poll', help='find changes with --watch by polling instead of inotify', action='store_true')
+    parser.add_argument('--serve', help='preview the Plogbook on a local http server, pages are rendered on demand so '
+                                        'they are never stale', nargs='?', const=8000, type=int, metavar='PORT')
 
     parser.add_argument('--localize_images', '-li', help='Localize images found in @src and store them in plog folder '
                                                          'under images/', action='store_true')
@@ -45,14 +81,23 @@ def run_argparse():
                                                    'current working directory')
     parser.add_argument('--editor', '-e', help='what editor to use to input plog message, i.e. nano')
     parser.add_argument('--markdown', '-md', help='markdown to html conversion for plog message', action='store_true')
+    parser.add_argument('--converter', help='markdown converter package to use, remembered for the Plogbook: '
+                                            'markdown2 (default), cmarkgfm, mistune or markdown')
+    parser.add_argument('--profile', help='time every phase of the command and count bytes written, files stat\'ed '
+                                          'and network bytes, JSON report is written to the given file or to stderr',
+                        nargs='?', const='', metavar='REPORT')
+    parser.add_argument('--cprofile', help='also run cProfile with --profile and dump it\'s stats to this file')
 
     args = parser.parse_args()
+    if args.profile is not None or args.cprofile:
+        start_profiler(args.profile, args.cprofile)
 
     plogbook = PlogBook(location=args.location)
     if len(sys.argv) < 2 or args.open or (args.location and (len(sys.argv) < 4)):
         # If Plogbook main.html exists open it else write plog
         main_path = os.path.join(args.location or '', 'main.html')
         if os.path.exists(main_path):
+            import webbrowser
             webbrowser.open(main_path)
         else:
             start_new = input("New Plogbook will be started in this folder, are you sure?(y/n)")
@@ -60,6 +105,11 @@ def run_argparse():
                 print("Now to finish up initiating write your first plog!")
                 args.write = True
 
+    if args.converter:
+        if not plogbook.set_converter(args.converter):
+            print('Markdown converter "{}" is not installed or not known'.format(args.converter))
+    if args.page_size:
+        plogbook.set_page_size(args.page_size)
     if args.build_template:
         plogbook.write_templates(files=args.build_template, override=args.override)
     if args.build_templates:
@@ -67,7 +117,7 @@ def run_argparse():
         plogbook.write_templates(override=args.override)
     if args.write or args.editor:
         if args.markdown:
-            if not MARKDOWN:
+            if plogbook.converter is None:
                 print('You need to install package "markdown2" for markdown conversion support, '
                       'try: sudo pip install markdown2\nNo conversion will be made!')
                 args.markdown = False
@@ -76,21 +126,76 @@ def run_argparse():
                             convert_img=args.localize_images,
                             override_theme=args.override_theme)
 
-    if args.find:
-        plogbook.find_plogs(recursive=False, pretty_output=args.pretty)
-    if args.findr:
-        plogbook.find_plogs(recursive=True, pretty_output=args.pretty)
+    listing = dict(pretty_output=args.pretty, output_format=args.format, categories=args.category, since=args.since,
+                   until=args.until, sort=args.sort, limit=args.limit)
+    try:
+        if args.find:
+            plogbook.find_plogs(recursive=False, **listing)
+        if args.findr:
+            plogbook.find_plogs(recursive=True, **listing)
+    except ValueError as e:  # unknown --sort key
+        parser.error(str(e))
+    if args.reindex:
+        plogbook.reindex()
+    if args.archive:
+        if args.before is None:
+            parser.error('--archive needs --before date')
+        from plogbook.archive import archive_plogs
+        print('archived {} plogs'.format(archive_plogs(plogbook, args.before, categories=args.category)))
     if args.rebuild_cat_theme:
         print('rebuilding theme for category: {}'.format(args.rebuild_cat_theme))
-        plogbook.write_theme(os.path.join(plogbook.location, args.rebuild_cat_theme))
+        changed = plogbook.write_theme(os.path.join(plogbook.location, args.rebuild_cat_theme))
+        print('{} files changed'.format(changed))
     if args.rebuild_main_theme:
         print('rebuilding theme Plogbook, loc: {}'.format(plogbook.location))
-        plogbook.write_theme()
+        print('{} files changed'.format(plogbook.write_theme()))
     if args.rebuild_cat_main:
         print('rebuilding category main page  for category: {}'.format(args.rebuild_cat_main))
-        plogbook.write_cat_html(os.path.join(plogbook.location, args.rebuild_cat_main))
+        changed = plogbook.write_cat_html(os.path.join(plogbook.location, args.rebuild_cat_main), force=True)
+        print('{} files changed'.format(changed))
     if args.rebuild_main:
         print('rebuilding Plogbook main page')
-        plogbook.write_main_html()
+        print('{} files changed'.format(plogbook.write_main_html()))
+    if args.rebuild_dates:
+        print('rebuilding date pages and feed')
+        plogbook.ensure_theme()
+        print('{} files changed'.format(plogbook.write_date_pages() + plogbook.write_feed()))
+    if args.rebuild_all:
+        from plogbook.rebuild import rebuild_all
+        rebuild_all(plogbook, jobs=args.jobs)
+    if args.import_from:
+        from plogbook.importer import read_records
+        plogbook.add_plogs(read_records(args.import_from), jobs=args.jobs, markdown=args.markdown,
+                           localize_img=args.localize_images)
+    if args.watch:
+        from plogbook.watch import watch
+        watch(plogbook, polling=args.poll)
+    if args.serve:
+        from plogbook.serve import serve
+        serve(plogbook, port=args.serve)
     if args.find_categories:
-        plogbook.find_categories(pretty_output=args.pretty)
+        try:
+            plogbook.find_categories(jobs=args.jobs, **listing)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.search:
+        plogbook.search(args.search, categories=args.category, since=args.since, until=args.until,
+                        limit=args.limit or 20, pretty_output=args.pretty)
+
+
+def start_profiler(report=None, cprofile=None):
+    """
+    Profiles the rest of the run, report is written when the program exits
+    :param report: file to write JSON report to, None or empty for stderr
+    :param cprofile: file to dump cProfile stats to
+    """
+    import atexit
+    from plogbook.profiling import Profiler
+    profiler = Profiler(cprofile=cprofile)
+
+    def stop():
+        profiler.stop()
+        profiler.write_report(report or None)
+
+    atexit.register(stop)
+    profiler.start()
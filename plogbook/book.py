@@ -1,11 +1,11 @@
 #!/usr/bin/env python2
 from __future__ import print_function
 import os
-import re
 import sys
+import json
 import fnmatch
-import tempfile
-import subprocess
+import functools
+import time
 
 from datetime import datetime
 
@@ -14,128 +14,254 @@ from datetime import datetime
 # # External package import (things that don't come with python and are optional)
 # Markdown2 is for markdown to html conversion
 # from plog import Plog
-from plogbook.plog import Plog
-
-
-try:
-    import markdown2
-except ImportError:
-    MARKDOWN = False
-else:
-    MARKDOWN = True
+from plogbook import utils, profiling
+from plogbook.plog import Plog, open_source, write_source, make_header, source_digest, plog_created
+from plogbook.archive import INDEX_FILE as ARCHIVE_INDEX, PACK_FILE, archived_plogs, static_href
+from plogbook.index import PlogIndex, MAIN_PAGE, INDEX_DIR, DATES_DIR, ASSETS_DIR, CATEGORY_FILE, CATEGORY_MARKERS, \
+    is_page, is_category, is_valid_category, category_created
+from plogbook.templates import load_template, DEFAULT_DIRECTORY
 
 # # multi-versioning
 VERSION = sys.version_info[0]
 IS_3 = True if VERSION == 3 else False
 if IS_3:
-    from urllib.request import urlopen
-    from urllib.parse import quote
-
     input = input
 else:
-    from urllib2 import urlopen
-    from urllib import quote
-
     input = raw_input
 
+# Placeholder for the position of an item on the page, items are cached with it and numbered when page is assembled
+ITEM_ID = '\x00item_id\x00'
+# Default number of items per page
+PAGE_SIZE = 100
+# characters of plog message paragraphs written at once when streaming a plog
+CHUNK_SIZE = 64 * 1024
+# threads scanning categories at once, scanning is bound by io latency rather than cpu
+SCAN_JOBS = 16
+# Atom feed of the newest plogs of the Plogbook and the number of plogs in it
+FEED_FILE = 'feed.atom'
+FEED_SIZE = 20
+
+
+def page_name(number):
+    """File name of a numbered page"""
+    return 'page-{}.html'.format(number)
+
+
+def main_page_name(number):
+    """File name of a numbered page of Plogbook main page, the first one is main.html"""
+    return 'main.html' if number == 1 else page_name(number)
+
+
+def remove_pages(directory, first):
+    """Removes numbered pages that are no longer needed, starting from page number first"""
+    number = max(first, 1)
+    while os.path.exists(os.path.join(directory, page_name(number))):
+        os.remove(os.path.join(directory, page_name(number)))
+        number += 1
+
+
+def month_page_name(year, month):
+    """File name of the date page of a month"""
+    return '{:04d}-{:02d}.html'.format(year, month)
+
+
+def year_page_name(year):
+    """File name of the date page of a year"""
+    return '{:04d}.html'.format(year)
+
+
+def month_range(year, month):
+    """
+    :return: (start, end) timestamps of a month in local time, end is the start of the next month
+    """
+    start = time.mktime((year, month, 1, 0, 0, 0, 0, 0, -1))
+    end = time.mktime((year + month // 12, month % 12 + 1, 1, 0, 0, 0, 0, 0, -1))
+    return start, end
+
+
+def atom_date(timestamp):
+    """:return: RFC 3339 UTC date of a timestamp for Atom feeds"""
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp))
+
+
+def make_pages_html(newer=None, older=None, up=None):
+    """
+    Generates links to the neighbouring pages
+    :param newer: file name of the page with newer items
+    :param older: file name of the page with older items
+    :param up: file name of the page listing this one, i.e. year page of a month page
+    """
+    links = []
+    if up:
+        links.append("<a id='pages_up' href='{}'>up</a>".format(utils.quote(up)))
+    if newer:
+        links.append("<a id='pages_newer' href='{}'>newer</a>".format(utils.quote(newer)))
+    if older:
+        links.append("<a id='pages_older' href='{}'>older</a>".format(utils.quote(older)))
+    if not links:
+        return ''
+    return "<div id='pages'>{}</div>".format(' '.join(links))
+
+
+def paragraphs(msg):
+    """
+    Turns every line of the message into a paragraph without copying the whole message
+    :param msg: message string or file object to read it from
+    :return: generator of <p> paragraphs
+    """
+    if not hasattr(msg, 'read'):
+        start = 0
+        end = msg.find('\n')
+        while end != -1:
+            yield '<p>{}</p>'.format(msg[start:end])
+            start = end + 1
+            end = msg.find('\n', start)
+        yield '<p>{}</p>'.format(msg[start:])
+        return
+    line = ''
+    for line in msg:
+        yield '<p>{}</p>'.format(line[:-1] if line.endswith('\n') else line)
+    if not line or line.endswith('\n'):  # same as splitting the whole message on new lines
+        yield '<p></p>'
+
+
+def _template_property(template):
+    """Property with the content of a template"""
+    return property(lambda self: self.get_template(template).source,
+                    doc='content of {} template, loaded on first use'.format(template))
+
 
 class PlogBook:
     """
     This is main class for Plogbook log book
     """
     templates = ['theme.css', 'plog.html', 'category.html', 'category_item.html', 'main.html', 'main_item.html']
+    template_theme = _template_property('theme.css')
+    template_plog = _template_property('plog.html')
+    template_cat = _template_property('category.html')
+    template_cat_item = _template_property('category_item.html')
+    template_main = _template_property('main.html')
+    template_main_item = _template_property('main_item.html')
 
-    def __init__(self, location=None):
+    def __init__(self, location=None, page_size=None):
         """
         :param location: location of the Plogbook, if not provided current working directory will be taken
+        :param page_size: number of items per category and main page, if not provided remembered one will be taken
         """
         self.location = location or os.getcwd()
-        self.template_theme = self.read_teamplate('theme.css') or self.read_default_template('theme.css')
-        self.template_plog = self.read_teamplate('plog.html') or self.read_default_template('plog.html')
-        self.template_cat = self.read_teamplate('category.html') or self.read_default_template('category.html')
-        self.template_cat_item = self.read_teamplate('category_item.html') or self.read_default_template('category_item.html')
-        self.template_main = self.read_teamplate('main.html') or self.read_default_template('main.html')
-        self.template_main_item = self.read_teamplate('main_item.html') or self.read_default_template('main_item.html')
+        self.index = PlogIndex(self.location)
+        self._page_size = page_size
+        self._templates = {}
+        self._converter = False  # not looked up yet, None when no converter is installed
+        self._render_cache = None
 
+    @profiling.timed('write_plog')
     def write_plog(self, editor=None, markdown=False, convert_img=False, override_theme=False):
         """
         This method is the main method that is being run to start the process of recording the plog
         :param editor: whether to take 'message' part of the input via editor, otherwise input from shell will be taken
         :param markdown: whether the 'message' aprt of the input is markdown and requires conversion, this requires
-        markdown2 external package
+        markdown2 or another converter package, see --converter
         :param convert_img: Whether to localize images found in 'img' tags, they will be saved over category/images/
         :param override_theme: Whether to override theme with a new one.
         """
         # Data Input and formatting
-        date = datetime.now().strftime('%x-%X')
-        print(''.center(80, '_'))
-        print('|' + 'Writting Plog for {}'.format(date).center(78) + '|')
-        print(''.center(80, '-'))
-        category = input('Category: ')
-        save_directory = os.path.join(self.location, category)
-        if not os.path.exists(save_directory):  # If category doesn't exist, make it
-            os.makedirs(save_directory)
-        title = input('Title: ')
-        file_name = os.path.join(save_directory, title + '.html')
-        print(''.center(80, '-'))
+        with profiling.phase('input'):
+            created = datetime.now()
+            date = created.strftime('%x-%X')
+            print(''.center(80, '_'))
+            print('|' + 'Writting Plog for {}'.format(date).center(78) + '|')
+            print(''.center(80, '-'))
+            category = input('Category: ')
+            if not is_valid_category(category):  # don't let plogs mix with Plogbook's own folders
+                category = category.replace(os.sep, '_').replace('/', '_').lstrip('.') + '_'
+                print('Category name is reserved, writing to category: {}'.format(category))
+            save_directory = os.path.join(self.location, category)
+            title = input('Title: ')
+            if is_page(title + '.html'):  # don't let generated pages overwrite the plog
+                title += '_'
+            file_name = os.path.join(save_directory, title + '.html')
+            print(''.center(80, '-'))
 
-        # # message input
-        # For message input use editor if editor is true otherwise use stdin.read()
-        msg = 'failed to capture message'
-        if not editor:
-            print('Log:')
-            msg = sys.stdin.read()
-        else:
-            with tempfile.NamedTemporaryFile(mode='w+t') as temp_file:
+            # # message input
+            # For message input use editor if editor is true otherwise use stdin.read()
+            session = None
+            if not editor:
+                print('Log:')
+                msg = sys.stdin.read()
+            else:
+                from plogbook.editor import EditorSession
+                session = EditorSession(editor, os.path.join(self.location, INDEX_DIR, 'drafts'))
                 print('<Log Input will be taken from editor: {}>'.format(editor))
-                subprocess.call([editor, temp_file.name])
-                while True:
-                    with open(temp_file.name) as f:
-                        contents = f.read()
-                        if contents:
-                            msg = contents
-                            break
+                msg = session.edit()
+                if msg is None:
+                    session.close()
+                    print('Log message is empty or unchanged, plog was not written')
+                    return None
                 print(msg)
+        source = msg
+        if not os.path.exists(save_directory):  # If category doesn't exist, make it
+            os.makedirs(save_directory)
 
         # If markdown convert to html
         print(''.center(80, '-'))
-        if markdown and MARKDOWN:
-            msg = markdown2.markdown(msg)
+        markdown = markdown and self.converter is not None
+        if markdown:
+            with profiling.phase('markdown'):
+                msg = self.markdown(msg)
             print('|' + 'converting log message to html(from markdown)'.center(78, ' ') + '|')
 
         # Converting html (bells and whistles)
         if convert_img:
             print('|' + 'converting html message through filters:'.center(78, ' ') + '|')
             print('|' + '-{}'.format('localize image' if convert_img else '').center(78, ' ') + '|')
-            msg = self.convert_html(msg, save_directory=save_directory, localize_img=convert_img)
+            msg = self.convert_html(msg, save_directory=save_directory, localize_img=convert_img,
+                                    cache_directory=os.path.join(self.location, INDEX_DIR, 'images'))
 
         # Making the plog from the data
         print('|' + 'Saving plog <{}.html>'.format(title).center(78, ' ') + '|')
         print('|' + 'to {}'.format(save_directory).center(78, ' ') + '|')
         print(''.center(80, '_'))
-        plog = self.make_log_html(msg=msg,
-                                  cat=category,
-                                  title=title,
-                                  date=date)
 
         ## Saving to disk
         # Log
-        with open(file_name, 'w') as html_file:
-            html_file.write(plog)
+        with profiling.phase('plog'):
+            with utils.atomic_file(file_name) as html_file:
+                self.write_log_html(html_file.write, msg=msg, cat=category, title=title, date=date,
+                                    created=time.mktime(created.timetuple()), source=source_digest(source))
+            # Source for rebuilding the plog
+            write_source(file_name, source, category=category, title=title, date=date,
+                         created=time.mktime(created.timetuple()), markdown=markdown,
+                         localize_img=bool(convert_img))
+        if session:  # draft is kept until the plog is safely written
+            session.close()
+        # Category marker
+        self.mark_category(save_directory)
         # Theme
-        if not os.path.exists(os.path.join(save_directory, 'theme.css')) or override_theme:
-            if override_theme:
-                print('Overriding theme with newly generated one')
+        if override_theme:
+            print('Overriding theme with newly generated one')
             self.write_theme(save_directory)
-        # Cat Main
-        self.write_cat_html(save_directory=save_directory)
-        # Plogbook Main
-        self.write_main_html(save_directory=self.location)
-        # Theme for Plogbook main
-        if not os.path.exists(os.path.join(self.location, 'theme.css')) or override_theme:
-            if override_theme:
-                print('Overriding theme with newly generated one')
-            self.write_theme(self.location)
+        else:
+            self.ensure_theme(save_directory)
+        # Index
+        with profiling.phase('index'):
+            self.index.add_plog(file_name)
+        # Cat Main and Plogbook Main
+        self.update_html(file_name)
+        # Theme for Plogbook main, only templates linking theme.css next to the page need it
+        if self.legacy_theme:
+            (self.write_theme if override_theme else self.ensure_theme)(self.location)
+
+    def add_plogs(self, records, jobs=None, markdown=False, localize_img=False):
+        """
+        Writes many plogs at once, pages are only updated at the end, see plogbook.importer.add_plogs
+        :param records: iterable of dicts with category, title and msg keys and optional created, markdown and
+        localize_img keys
+        :param jobs: number of worker processes, defaults to cpu count
+        :return: list of locations of written plogs
+        """
+        from plogbook import importer
+        return importer.add_plogs(self, records, jobs=jobs, markdown=markdown, localize_img=localize_img)
 
     def read_teamplate(self, template):
         """
@@ -155,13 +281,32 @@ class PlogBook:
         with open(template_path, 'r') as of:
             return of.read()
 
+    def get_template(self, template):
+        """
+        Returns parsed template, templates in <Plogbook>/templates take precedence over the default ones.
+        Templates are loaded when they are first used.
+        :param template: template file name, i.e. theme.css, see self.templates for full names
+        :return: plogbook.templates.Template
+        """
+        loaded = self._templates.get(template)
+        if loaded is None:
+            formatted = not template.endswith('.css')
+            loaded = load_template(os.path.join(self.location, 'templates', template), template, formatted) or \
+                load_template(os.path.join(DEFAULT_DIRECTORY, template), template, formatted)
+            self._templates[template] = loaded
+        return loaded
+
+    def reload_templates(self):
+        """Makes templates load again on their next use, i.e. after they were edited"""
+        self._templates = {}
+
     def read_default_template(self, template):
         """
         Returns default template read from "default_styles" directory
         :param template: template name see, self.templates or default_styles directory for all possible names
         :return: returns template file contents.
         """
-        template_path = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'default_styles', template)
+        template_path = os.path.join(DEFAULT_DIRECTORY, template)
         with open(template_path, 'r') as of:
             return of.read()
 
@@ -172,6 +317,7 @@ class PlogBook:
         :param override: Whether to override even if style already exist
         :param files: list of which files to override, from the following: theme, plog,category, category_item, main_page,
         main_page_item. None will write ALL.
+        :return: number of changed files
         """
         if not save_directory:
             save_directory = self.location
@@ -190,208 +336,942 @@ class PlogBook:
                       ' must be one of:\n{}'.format(file, ', '.join(self.templates)))
                 del files[index]
 
+        changed = 0
         for file in files:
             file_path = os.path.join(template_dir, file)
             if not os.path.exists(file_path) or override:
-                print('created:', file_path)
-                with open(file_path, mode='w') as of:
-                    of.write(self.read_default_template(file))
+                if utils.write_file(file_path, self.read_default_template(file)):
+                    print('created:', file_path)
+                    changed += 1
+        return changed
+
+    @property
+    def theme_location(self):
+        """location of the theme asset, it's named by hash of the theme so browsers can cache it for good"""
+        return os.path.join(self.location, ASSETS_DIR, 'theme.{}.css'.format(self.get_template('theme.css').fingerprint))
+
+    @property
+    def legacy_theme(self):
+        """whether some page template links theme.css next to the page instead of the {theme} asset"""
+        return any('theme' not in self.get_template(template).fields
+                   for template in ('plog.html', 'category.html', 'main.html'))
+
+    def theme_href(self, directory):
+        """
+        :param directory: directory of the page linking the theme
+        :return: url of the theme asset relative to the page
+        """
+        return utils.quote(os.path.relpath(self.theme_location, directory).replace(os.sep, '/'))
 
+    @profiling.timed('theme')
     def write_theme(self, save_directory=None):
         """
-        Generates and writes theme.css to save_directory
+        Writes theme to <Plogbook>/assets/theme.<hash>.css and it's gzipped copy, every page links to it.
+        Assets of previous themes are kept for plogs that weren't rebuilt since the theme changed.
+        :param save_directory: where to write a theme.css copy if page templates link one next to the page
+        :return: number of changed files
         """
-        if not save_directory:
-            save_directory = self.location
-        with open(os.path.join(save_directory, 'theme.css'), 'w') as css_file:
-            css_file.write(self.template_theme)
+        theme = self.get_template('theme.css').source
+        location = self.theme_location
+        if not os.path.exists(os.path.dirname(location)):
+            os.makedirs(os.path.dirname(location))
+        changed = utils.write_file(location, theme) + utils.write_file(location + '.gz', utils.gzip_bytes(theme))
+        if self.legacy_theme and utils.write_file(os.path.join(save_directory or self.location, 'theme.css'), theme):
+            changed += 1
+            category = self.index.category(save_directory) if save_directory and self.index.exists() else None
+            if category is not None:  # own writes don't make the category look changed to reindex
+                self.index.touch_category(category)
+        return changed
+
+    def ensure_theme(self, save_directory=None):
+        """
+        Writes theme unless it's already written, see write_theme
+        :return: number of changed files
+        """
+        if os.path.exists(self.theme_location) and \
+                (not self.legacy_theme or os.path.exists(os.path.join(save_directory or self.location, 'theme.css'))):
+            return 0
+        return self.write_theme(save_directory)
+
+    @staticmethod
+    def mark_category(save_directory, created=None):
+        """
+        Writes marker file that makes save_directory a category, it keeps the creation time of the category
+        :param created: creation timestamp, defaults to now
+        :return: whether the marker was written
+        """
+        marker = os.path.join(save_directory, CATEGORY_FILE)
+        if os.path.exists(marker):
+            return False
+        return utils.write_file(marker, json.dumps({'created': time.time() if created is None else created}))
 
-    def write_cat_html(self, save_directory):
+    @profiling.timed('category_pages')
+    def write_cat_html(self, save_directory, force=False):
         """
-        Generates and writes main.html to save_directory
+        Generates and writes main.html with the newest plogs of a category to save_directory.
+        Older plogs are written to page-<n>.html pages of page_size plogs each, counting from the oldest so a full
+        page only changes when it's plogs do, pages that are already up to date are not regenerated.
+        :param force: regenerate every page even if it's recorded as up to date
+        :return: number of changed files
         """
-        with open(os.path.join(save_directory, 'main.html'), 'w') as main:
-            main.write(self.make_cat_html(directory=save_directory))
+        category = self.index.category(save_directory) if self.index.exists() else None
+        count, items = self._cat_items(save_directory, category)
+        page_size = self.page_size
+        full_pages = count // page_size
+        template = self.get_template('category.html').fingerprint + self.get_template('category_item.html').fingerprint
+        theme = self.theme_href(save_directory)
+        # pages that end before the oldest changed item keep their items, a rewritten or an older plog shifts the rest
+        stale = self.index.stale_position(category) if category is not None else 0
+        changed = 0
+        for number in range(1, full_pages + 1):
+            has_newer = number < full_pages
+            key = utils.fingerprint('|'.join([template, theme, str(page_size), str(number), str(has_newer)]))
+            page_location = os.path.join(save_directory, page_name(number))
+            if not force and number * page_size <= stale and self.index.page_digest(category, number) == key and \
+                    os.path.exists(page_location):
+                continue
+            parts = []
+            self._write_cat_page(parts.append, count, items, number, theme)
+            changed += utils.write_file(page_location, ''.join(parts))
+            if category is not None:
+                self.index.set_page_digest(category, number, key)
+        remove_pages(save_directory, full_pages + 1)
+        parts = []
+        self._write_cat_main(parts.append, count, items, theme)
+        changed += utils.write_file(os.path.join(save_directory, 'main.html'), ''.join(parts))
+        if category is not None:
+            self.index.set_stale_position(category, count)
+        if changed and category is not None:  # own writes don't make the category look changed to reindex
+            self.index.touch_category(category)
+        return changed
 
+    @profiling.timed('main_pages')
     def write_main_html(self, save_directory=None):
         """
-        Generates and writes landing main.html for the whole Plogbook to save_directory
+        Generates and writes landing main.html for the whole Plogbook to save_directory.
+        Categories that don't fit to main.html are written to page-<n>.html pages, only changed pages are written.
+        :return: number of changed files
         """
         if not save_directory:
             save_directory = self.location
-        with open(os.path.join(save_directory, 'main.html'), 'w') as main:
-            main.write(self.make_main_html(directory=save_directory))
+        indexed = self.index.exists() and os.path.abspath(save_directory) == self.index.location
+        count, items = self._main_items(save_directory, indexed)
+        page_size = self.page_size
+        pages_count = max(1, -(-count // page_size))
+        theme = self.theme_href(save_directory)
+        changed = 0
+        for number in range(1, pages_count + 1):
+            parts = []
+            self._write_main_page(parts.append, count, items, number, theme)
+            page = ''.join(parts)
+            page_location = os.path.join(save_directory, main_page_name(number))
+            digest = utils.fingerprint(page)
+            if indexed and self.index.page_digest(MAIN_PAGE, number) == digest and os.path.exists(page_location):
+                continue
+            changed += utils.write_file(page_location, page)
+            if indexed:
+                self.index.set_page_digest(MAIN_PAGE, number, digest)
+        remove_pages(save_directory, pages_count + 1)
+        return changed
+
+    @property
+    def page_size(self):
+        """Number of items per category and main page, remembered in the index"""
+        if self._page_size is None:
+            self._page_size = PAGE_SIZE
+            if self.index.exists():
+                self._page_size = int(self.index.setting('page_size', PAGE_SIZE))
+        return self._page_size
+
+    def set_page_size(self, page_size):
+        """
+        Sets and remembers the number of items per category and main page, rebuild pages to apply it.
+        """
+        self._page_size = page_size
+        self.index.set_setting('page_size', page_size)
+
+    @property
+    def converter(self):
+        """Markdown converter chosen for the Plogbook or first installed one, None if none is installed"""
+        if self._converter is False:
+            from plogbook import render
+            name = self.index.setting('converter') if self.index.exists() else None
+            self._converter = render.get_converter(name) or render.get_converter()
+        return self._converter
+
+    def set_converter(self, name):
+        """
+        Chooses and remembers markdown converter of the Plogbook
+        :param name: converter name, see plogbook.render.CONVERTERS
+        :return: whether the converter is installed
+        """
+        from plogbook import render
+        converter = render.get_converter(name)
+        if converter is None:
+            return False
+        self._converter = converter
+        self.index.set_setting('converter', name)
+        return True
+
+    @property
+    def render_cache(self):
+        """Cache of html converted from markdown, see plogbook.render.RenderCache"""
+        if self._render_cache is None:
+            from plogbook import render
+            self._render_cache = render.RenderCache(os.path.join(self.location, INDEX_DIR, render.RENDER_FILE))
+        return self._render_cache
+
+    def markdown(self, msg):
+        """
+        Converts markdown to html with the Plogbook converter, conversions are cached by content
+        :param msg: markdown source
+        :return: html
+        """
+        return self.render_cache.render(msg, self.converter)
+
+    def update_html(self, plog_location):
+        """
+        Updates category main.html and Plogbook main.html after a plog was written.
+        Only the items of the plog and of it's category are rendered, the rest of the items are taken from the index.
+        :param plog_location: location of the written plog
+        """
+        category_location = os.path.dirname(plog_location)
+        category = self.index.category(category_location) if self.index.exists() else None
+        if category is not None:
+            plog = Plog(location=plog_location, category=category)
+            self.index.set_page_item(category, self.get_template('category_item.html').fingerprint,
+                                     plog.title, plog.created, self.make_cat_item(plog))
+            for name, location, created, plog_count in self.index.categories(category):
+                cat = PlogCategory(name=name, location=location, plog_count=plog_count, created=created)
+                self.index.set_page_item(MAIN_PAGE, self.get_template('main_item.html').fingerprint,
+                                         cat.name, cat.plog_count, self.make_main_item(cat))
+        self.write_cat_html(save_directory=category_location)
+        self.write_main_html(save_directory=self.location)
+        self.write_date_pages(created=Plog(location=plog_location).created)
+        self.write_feed()
 
-    def make_main_html(self, directory=None):
+    @profiling.timed('date_pages')
+    def write_date_pages(self, created=None):
+        """
+        Generates and writes date pages to <Plogbook>/dates: main.html lists the years, <year>.html lists months of a
+        year and <year>-<month>.html lists plogs of a month.
+        :param created: creation timestamp of a new plog, only the page of it's month is written, year pages are only
+        written when the month or the year is new. None writes every date page.
+        :return: number of changed files
+        """
+        directory = os.path.join(self.location, DATES_DIR)
+        if os.path.exists(os.path.join(directory, CATEGORY_FILE)):  # category of a Plogbook older than date pages
+            print('Date pages are not written, "{}" is a category, rename it to get them'.format(DATES_DIR))
+            return 0
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        if created is None:
+            return self._write_all_date_pages(directory)
+        date = datetime.fromtimestamp(created)
+        month_location = os.path.join(directory, month_page_name(date.year, date.month))
+        year_location = os.path.join(directory, year_page_name(date.year))
+        new_month = not os.path.exists(month_location)
+        new_year = not os.path.exists(year_location)
+        changed = utils.write_file(month_location, self.make_month_html(date.year, date.month))
+        if new_month or new_year:
+            changed += utils.write_file(year_location, self.make_year_html(date.year))
+        if new_year:
+            changed += utils.write_file(os.path.join(directory, 'main.html'), self.make_dates_html())
+        return changed
+
+    def _write_all_date_pages(self, directory):
+        """Writes every date page from one pass over the plogs, pages of months without plogs are removed"""
+        months = {}
+        for plog in self.iter_plogs():
+            date = datetime.fromtimestamp(plog.created)
+            months.setdefault((date.year, date.month), []).append(plog)
+        years = {}
+        for year, month in months:
+            years.setdefault(year, []).append(month)
+        pages = set(['main.html'])
+        changed = 0
+        for (year, month), plogs in months.items():
+            pages.add(month_page_name(year, month))
+            changed += utils.write_file(os.path.join(directory, month_page_name(year, month)),
+                                        self.make_month_html(year, month, plogs))
+        for year, year_months in years.items():
+            pages.add(year_page_name(year))
+            changed += utils.write_file(os.path.join(directory, year_page_name(year)),
+                                        self.make_year_html(year, year_months))
+        changed += utils.write_file(os.path.join(directory, 'main.html'), self.make_dates_html(list(years)))
+        for entry in utils.scan_directory(directory):
+            if fnmatch.fnmatch(entry.name, '*.html') and entry.name not in pages:
+                os.remove(entry.path)
+        return changed
+
+    def make_month_html(self, year, month, plogs=None):
+        """
+        Generates date page of a month, it lists plogs created in the month from the newest
+        :param plogs: plogs of the month, looked up by their creation date when not given
+        """
+        if plogs is None:
+            start, end = month_range(year, month)
+            plogs = [plog for plog in self.iter_plogs(since=start, until=end) if plog.created < end]
+        plogs = sorted(plogs, key=lambda plog: (plog.created, plog.title))
+        items = self.get_template('category_item.html').render_many(
+            dict(cat_id=ITEM_ID, date=plog.date, title=plog.title.replace('.html', ''), location=plog.location,
+                 relative_location=self._plog_href(plog, '../')) for plog in plogs)
+        return self._make_date_page(items, up=year_page_name(year))
+
+    def make_year_html(self, year, months=None):
+        """
+        Generates date page of a year, it lists months of the year that have plogs from the latest
+        :param months: numbers of the months that have plogs, looked up when not given
+        """
+        if months is None:
+            start, end = month_range(year, 1)[0], month_range(year + 1, 1)[0]
+            months = set(datetime.fromtimestamp(plog.created).month
+                         for plog in self.iter_plogs(since=start, until=end) if plog.created < end)
+        directory = os.path.join(self.location, DATES_DIR)
+        items = self.get_template('category_item.html').render_many(
+            dict(cat_id=ITEM_ID, date=datetime(year, month, 1).strftime('%B %Y'),
+                 title=month_page_name(year, month).replace('.html', ''),
+                 location=os.path.join(directory, month_page_name(year, month)),
+                 relative_location=utils.quote(month_page_name(year, month))) for month in sorted(months))
+        return self._make_date_page(items, up='main.html')
+
+    def make_dates_html(self, years=None):
+        """
+        Generates main date page, it lists years that have plogs from the latest
+        :param years: years that have plogs, looked up when not given
+        """
+        if years is None:
+            years = set(datetime.fromtimestamp(plog.created).year for plog in self.iter_plogs())
+        directory = os.path.join(self.location, DATES_DIR)
+        items = self.get_template('category_item.html').render_many(
+            dict(cat_id=ITEM_ID, date=str(year), title=str(year),
+                 location=os.path.join(directory, year_page_name(year)),
+                 relative_location=utils.quote(year_page_name(year))) for year in sorted(years))
+        return self._make_date_page(items, up='../main.html')
+
+    @staticmethod
+    def _plog_href(plog, prefix=''):
+        """:return: url of a plog relative to the Plogbook, archived plogs link their static archive page"""
+        href = static_href(plog.location) or utils.quote(plog.title)
+        return '{}{}/{}'.format(prefix, utils.quote(plog.category), href)
+
+    def _make_date_page(self, items, up):
+        """Assembles date page from the items ordered from the oldest, the newest go first"""
+        parts = []
+        self._write_page(parts.append, self.get_template('category.html'), reversed(self._numbered(items, 0)),
+                         make_pages_html(up=up), self.theme_href(os.path.join(self.location, DATES_DIR)))
+        return ''.join(parts)
+
+    @profiling.timed('feed')
+    def write_feed(self, size=FEED_SIZE):
+        """
+        Writes Atom feed of the newest plogs to <Plogbook>/feed.atom, see make_feed
+        :return: number of changed files
+        """
+        return int(utils.write_file(os.path.join(self.location, FEED_FILE), self.make_feed(size)))
+
+    def make_feed(self, size=FEED_SIZE):
+        """
+        Generates Atom feed of the newest plogs of the Plogbook.
+        Only size newest rows are read from the index, without the index plogs go through a heap of size plogs so the
+        rest of the plogs are never sorted.
+        :param size: number of plogs in the feed
+        """
+        from xml.sax.saxutils import escape, quoteattr
+        if self.index.exists():
+            plogs = [Plog(location=location, category=category, title=title, created=created)
+                     for location, category, title, created in self.index.newest_plogs(size)]
+        else:
+            from plogbook import output
+            plogs = list(output.select(self.iter_plogs(), '-date', output.PLOG_SORT, size))
+        name = os.path.basename(os.path.abspath(self.location))
+        lines = ['<?xml version="1.0" encoding="utf-8"?>',
+                 '<feed xmlns="http://www.w3.org/2005/Atom">',
+                 '  <title>{}</title>'.format(escape(name)),
+                 '  <id>tag:plogbook,2014:{}</id>'.format(escape(utils.quote(name))),
+                 '  <updated>{}</updated>'.format(atom_date(plogs[0].created if plogs else 0)),
+                 '  <author><name>{}</name></author>'.format(escape(name)),
+                 '  <link href="main.html"/>']
+        for plog in plogs:
+            key = utils.quote('{}/{}'.format(plog.category, plog.title))  # stays the same when plog is archived
+            lines.extend(['  <entry>',
+                          '    <title>{}</title>'.format(escape(plog.title.replace('.html', ''))),
+                          '    <id>tag:plogbook,{}:{}</id>'.format(atom_date(plog.created)[:10], escape(key)),
+                          '    <link href={}/>'.format(quoteattr(self._plog_href(plog))),
+                          '    <published>{0}</published><updated>{0}</updated>'.format(atom_date(plog.created)),
+                          '    <category term={}/>'.format(quoteattr(plog.category)),
+                          '  </entry>'])
+        lines.append('</feed>')
+        return '\n'.join(lines) + '\n'
+
+    @profiling.timed('make_main_html')
+    def make_main_html(self, directory=None, page=1):
         """
         Generates main.html for the Plogbook.
+        :param page: number of the page, 1 for main.html
+        :return: html or None if there's no such page
         """
         if not directory:
             directory = self.location
+        indexed = self.index.exists() and os.path.abspath(directory) == self.index.location
+        count, items = self._main_items(directory, indexed)
+        if not 1 <= page <= max(1, -(-count // self.page_size)):
+            return None
+        parts = []
+        self._write_main_page(parts.append, count, items, page, self.theme_href(directory))
+        return ''.join(parts)
+
+    def _write_main_page(self, write, count, items, number, theme):
+        """
+        Writes page of the Plogbook main page, pages are numbered from the categories with the most plogs
+        """
+        page_size = self.page_size
+        pages_count = max(1, -(-count // page_size))
+        start = (number - 1) * page_size
+        pages = make_pages_html(newer=main_page_name(number - 1) if number > 1 else None,
+                                older=main_page_name(number + 1) if number < pages_count else None)
+        self._write_page(write, self.get_template('main.html'), self._numbered(items(start, start + page_size), start),
+                         pages, theme)
+
+    def _main_items(self, directory, indexed):
+        """
+        Rendered category items of the main page, ordered by plog count
+        :return: (item count, function returning list of items from start to stop position)
+        """
+        template = self.get_template('main_item.html').fingerprint
+        if indexed and self.index.items_cached(MAIN_PAGE, template):
+            return (self.index.items_count(MAIN_PAGE, template),
+                    lambda start, stop: self.index.page_items(MAIN_PAGE, template, start, stop, descending=True))
         categories = self.find_categories(directory=directory, silent=True)
-        categories = sorted(categories, key=lambda x: x.plog_count, reverse=True)
-        items = []
-        for index, cat in enumerate(categories):
-            plog_count = cat.plog_count
-            items.append(self.template_main_item.format(template=self.template_main_item,
-                                                        relative_location=quote(os.path.join(cat.name, 'main.html')),
-                                                        name=cat.name,
-                                                        count=plog_count,
-                                                        date=cat.creation_date,
-                                                        location=cat.location,
-                                                        main_id=index + 1))
-        items = '\n'.join(items)
-        completed_main = self.template_main.format(template=self.template_main,items=items)
-        return completed_main
-
-    def make_cat_html(self, directory=None):
+        categories = sorted(categories, key=lambda x: (-x.plog_count, x.name))
+        items = self.get_template('main_item.html').render_many(self._main_item_fields(cat) for cat in categories)
+        if indexed:
+            self.index.set_page_items(MAIN_PAGE, template,
+                                      [(cat.name, cat.plog_count, item) for cat, item in zip(categories, items)])
+        return len(items), lambda start, stop: items[start:stop]
+
+    def make_main_item(self, cat):
+        """
+        Generates main.html item of a category, item position is left as ITEM_ID placeholder.
+        """
+        return self.get_template('main_item.html').render(**self._main_item_fields(cat))
+
+    @staticmethod
+    def _main_item_fields(cat):
+        return dict(relative_location=utils.quote(os.path.join(cat.name, 'main.html')),
+                    name=cat.name,
+                    count=cat.plog_count,
+                    date=cat.creation_date,
+                    location=cat.location,
+                    main_id=ITEM_ID)
+
+    @profiling.timed('make_cat_html')
+    def make_cat_html(self, directory=None, page=None):
         """
         Generates main.html for a category
         :param directory: where to look for plogs if None will look in self.location
+        :param page: number of the page-<n>.html page to generate instead of main.html
+        :return: html or None if there's no such page
         """
         if not directory:
             directory = self.location
+        category = self.index.category(directory) if self.index.exists() else None
+        count, items = self._cat_items(directory, category)
+        parts = []
+        if page is None:
+            self._write_cat_main(parts.append, count, items, self.theme_href(directory))
+        elif 1 <= page <= count // self.page_size:
+            self._write_cat_page(parts.append, count, items, page, self.theme_href(directory))
+        else:
+            return None
+        return ''.join(parts)
+
+    def _write_cat_page(self, write, count, items, number, theme):
+        """
+        Writes full page-<number>.html of a category, pages are numbered from the oldest plogs
+        """
+        page_size = self.page_size
+        start = (number - 1) * page_size
+        pages = make_pages_html(newer=page_name(number + 1) if number < count // page_size else 'main.html',
+                                older=page_name(number - 1) if number > 1 else None)
+        self._write_page(write, self.get_template('category.html'),
+                         reversed(self._numbered(items(start, start + page_size), start)), pages, theme)
+
+    def _write_cat_main(self, write, count, items, theme):
+        """
+        Writes main.html of a category, it shows page_size newest plogs and links to the page with older ones
+        :param theme: url of the theme relative to the category
+        """
+        page_size = self.page_size
+        start = max(0, count - page_size)
+        older = None
+        if start:  # newest plog that isn't shown is on full page
+            older = page_name((start - 1) // page_size + 1)
+        self._write_page(write, self.get_template('category.html'), reversed(self._numbered(items(start, count), start)),
+                         make_pages_html(older=older), theme)
+
+    def _cat_items(self, directory, category):
+        """
+        Rendered plog items of category main page, ordered from the oldest
+        :return: (item count, function returning list of items from start to stop position)
+        """
+        template = self.get_template('category_item.html').fingerprint
+        if category is not None and self.index.items_cached(category, template):
+            return (self.index.items_count(category, template),
+                    lambda start, stop: self.index.page_items(category, template, start, stop))
         found_plogs = self.find_plogs(directory=directory, silent=True, recursive=False)
-        found_plogs = sorted(found_plogs, key=lambda x: x.date, reverse=True)
-        items = []
-        for index, plog in enumerate(found_plogs):
-            items.append(self.template_cat_item.format(template=self.template_cat_item,
-                                                       cat_id=index + 1,
-                                                       date=plog.date,
-                                                       relative_location=quote(plog.title),
-                                                       title=plog.title.replace('.html', ''),
-                                                       location=plog.location))
-        items = '\n'.join(items)
-        completed_main = self.template_cat.format(template=self.template_cat, items=items)
-        return completed_main
-
-    def make_log_html(self, msg, cat, title, date):
+        found_plogs = sorted(found_plogs, key=lambda x: (x.created, x.title))
+        items = self.get_template('category_item.html').render_many(self._cat_item_fields(plog) for plog in found_plogs)
+        if category is not None:
+            self.index.set_page_items(category, template,
+                                      [(plog.title, plog.created, item) for plog, item in zip(found_plogs, items)])
+        return len(items), lambda start, stop: items[start:stop]
+
+    def make_cat_item(self, plog):
+        """
+        Generates category main.html item of a plog, item position is left as ITEM_ID placeholder.
+        """
+        return self.get_template('category_item.html').render(**self._cat_item_fields(plog))
+
+    @staticmethod
+    def _cat_item_fields(plog):
+        return dict(cat_id=ITEM_ID,
+                    date=plog.date,
+                    relative_location=static_href(plog.location) or utils.quote(plog.title),
+                    title=plog.title.replace('.html', ''),
+                    location=plog.location)
+
+    @staticmethod
+    def _numbered(items, start):
+        """
+        Fills in item positions
+        :param items: list of items
+        :param start: position of the first item
+        """
+        return [item.replace(ITEM_ID, str(start + index + 1)) for index, item in enumerate(items)]
+
+    @staticmethod
+    def _write_page(write, template, items, pages, theme):
+        """
+        Streams page to write function item by item instead of formatting the whole page at once
+        :param write: function that takes a string, i.e. file.write
+        :param template: page Template with {items} and optional {pages} and {theme} placeholders
+        :param items: iterable of rendered items
+        :param pages: html of links to the other pages
+        :param theme: url of the theme relative to the page
+        """
+        head, tail = template.split('items', pages=pages, theme=theme)
+        write(head)
+        for index, item in enumerate(items):
+            if index:
+                write('\n')
+            write(item)
+        write(tail)
+
+    @profiling.timed('make_log_html')
+    def make_log_html(self, msg, cat, title, date, created=None, source=None):
         """
         Converts data to html fil.
         Turns all input new lines into paragraphs
         """
-        msg = ''.join(['<p>{msg}</p>'.format(msg=msg) for msg in msg.split('\n')])
-        log = self.template_plog.format(template=self.template_plog, msg=msg, cat=cat, date=date, title=title)
-        return log
+        parts = []
+        self.write_log_html(parts.append, msg, cat, title, date, created=created, source=source)
+        return ''.join(parts)
+
+    def write_log_html(self, write, msg, cat, title, date, created=None, source=None):
+        """
+        Streams plog html, message paragraphs are written in chunks between the parts of the template around {msg}
+        so the message is never copied whole
+        :param write: callable taking parts of the html, i.e. write method of a file
+        :param msg: message string or file object to read it from
+        :param created: creation timestamp, when given the plog starts with a metadata header, see plog.read_header
+        :param source: digest of the original log message for the header, see plog.source_digest
+        """
+        if created is not None:
+            write(make_header(cat, title, created, source))
+        head, tail = self.get_template('plog.html').split('msg', cat=cat, date=date, title=title,
+                                                          theme=self.theme_href(os.path.join(self.location, cat)))
+        write(head)
+        chunk = []
+        size = 0
+        for paragraph in paragraphs(msg):
+            chunk.append(paragraph)
+            size += len(paragraph)
+            if size >= CHUNK_SIZE:
+                write(''.join(chunk))
+                chunk = []
+                size = 0
+        write(''.join(chunk))
+        write(tail)
+
+    def rebuild_plog(self, location):
+        """
+        Re-renders plog from it's source file with the current templates, the plog is only written when it changed
+        :param location: location of the plog .html file
+        :return: True if plog was rebuilt, False if plog has no source to rebuild from
+        """
+        source = open_source(location)
+        if source is None:
+            return False
+        parts = []
+        self.write_plog_html(parts.append, location, source)
+        utils.write_file(location, ''.join(parts))
+        return True
+
+    def write_plog_html(self, write, location, source):
+        """
+        Streams plog html rendered from it's source with the current templates
+        :param write: callable taking parts of the html
+        :param location: location of the plog .html file
+        :param source: (metadata, message file) of the plog, see plog.open_source
+        """
+        meta, msg = source
+        with msg:  # plain messages are streamed from the source file line by line
+            start = msg.tell()
+            digest = source_digest(msg)
+            msg.seek(start)
+            created = meta.get('created')
+            if created is None:  # sources of old plogs don't have it, keep the date they are listed with
+                created = plog_created(location)
+            self.write_log_html(write, msg=self._source_message(location, meta, msg), cat=meta['category'],
+                                title=meta['title'], date=meta['date'], created=created, source=digest)
+
+    def write_plog_message(self, write, location, source):
+        """
+        Streams message paragraphs of a plog rendered from it's source without the plog template, i.e. for archive pages
+        :param write: callable taking parts of the html
+        :param location: location of the plog .html file
+        :param source: (metadata, message file) of the plog, see plog.open_source
+        """
+        meta, msg = source
+        with msg:
+            for paragraph in paragraphs(self._source_message(location, meta, msg)):
+                write(paragraph)
+
+    def _source_message(self, location, meta, msg):
+        """
+        Converts message of a plog source the way it was converted when the plog was written
+        :return: message html or the message file itself when the message is plain
+        """
+        markdown = meta.get('markdown') and self.converter is not None
+        if markdown or meta.get('localize_img'):
+            msg = msg.read()
+        if markdown:  # unchanged sources come from the render cache
+            msg = self.markdown(msg)
+        if meta.get('localize_img'):  # images were downloaded when the plog was written
+            directory = os.path.dirname(location)
+            if os.path.basename(directory) == PACK_FILE:  # images of archived plogs stay in the category
+                directory = os.path.dirname(directory)
+            msg = self.convert_html(msg, save_directory=directory, localize_img=True,
+                                    download=False, cache_directory=os.path.join(self.location, INDEX_DIR, 'images'))
+        return msg
 
     @staticmethod
-    def convert_html(html, save_directory, localize_img=False):
+    @profiling.timed('convert_html')
+    def convert_html(html, save_directory, localize_img=False, download=True, cache_directory=None):
         """
         Makes html text go through various conversions
         :param html: html string
         :param save_directory: directory where html file will be saved
         :param localize_img: localizes images in the source and store them in location/title/images/
+        :param download: whether to download localized images or only point @src to already downloaded ones
+        :param cache_directory: shared image cache so images localized for other plogs aren't downloaded again,
+        defaults to save_directory/images
         :return: updated html string
         """
         if localize_img:
-            # Handle file location
-            image_location = os.path.join(save_directory, 'images')
-            if not os.path.exists(image_location):
-                os.makedirs(image_location)
-            # Find tags and replace them with new ones
-            img_tags = re.findall('img.*?src="(.*?)"', html)
-            for src in img_tags:
-                new_src = ''.join(re.findall('(\w+|\.)', src))
-                html = html.replace(src, "images/" + new_src)
-                # Downloading and saving
-                with open(os.path.join(image_location, new_src), 'wb') as image_file:
-                    image_source = urlopen(src).read()
-                    image_file.write(image_source)
+            from plogbook.images import localize_images
+            html = localize_images(html, save_directory, cache_directory=cache_directory, download=download)
         return html
 
-    def find_plogs(self, directory=None, recursive=True, pretty_output=False, silent=False):
+    @profiling.timed('find_plogs')
+    def find_plogs(self, directory=None, recursive=True, pretty_output=False, silent=False, output_format=None,
+                   categories=None, since=None, until=None, sort=None, limit=None):
         """
         Finds all possible plogs in in the current directory.
+        Plogs are printed as they are found, sorting with a limit keeps only the top plogs in memory.
         :param directory: where to look for plogs, defaults to self.location.
         :param recursive (default True): whether to recursively walk through every directory.
         :param pretty_output: data will be printed in a pretty table.
         :param silent: no data will be printed.
+        :param output_format: text (default), jsonl, csv or tsv.
+        :param categories: names of categories to list plogs of, None for all.
+        :param since: timestamp, only plogs created since then.
+        :param until: timestamp, only plogs created until then.
+        :param sort: date, title, category or location, prefixed with - for descending order.
+        :param limit: max number of plogs.
+        :return: list of plogs if silent, otherwise number of printed plogs
         """
-        # based on http://stackoverflow.com/a/2186565/3737009, upvote the man!
-        if not directory:
-            directory = self.location
-        found = []
-        if recursive:
-            for root, dirnames, filenames in os.walk(directory):
-                if 'theme.css' not in filenames:
-                    continue
-                for filename in fnmatch.filter(filenames, '*.html'):
-                    if filename == 'main.html':
-                        continue
-                    found.append(Plog(location=os.path.join(root, filename),
-                                      title=filename))
-        else:
-            only_files = fnmatch.filter(os.listdir(directory), '*.html')
-            for file in only_files:
-                if file == 'main.html':
-                    continue
-                found.append(Plog(location=os.path.join(directory, file)))
-
+        from plogbook import output
+        found = output.select(self.iter_plogs(directory, recursive, categories=categories, since=since, until=until),
+                              sort, output.PLOG_SORT, limit)
         if silent:
-            return found
+            return list(found)
+        if output_format and output_format != 'text':
+            return output.write_rows(found, output.PLOG_FIELDS, output_format)
         if pretty_output:
             print(''.center(145, '-'))
             print('{}|{}|{}|{}'.format('Location'.ljust(80, ' '), 'Category'.center(20, ' '), 'Title'.center(20, ' '),
                                        'Date'.center(20, ' ')))
             print(''.center(145, '-'))
+        count = 0
         for f in found:
             print(f.__str__(pretty=pretty_output))
-        return found
+            count += 1
+        return count
 
-    def find_categories(self, directory=None, pretty_output=False, silent=False):
-        """finds plog categories in a directory
-        :param directory: Plogbook directory, defaults to self.location
-        :param pretty_output: data will be printed in a pretty table.
-        :param silent: no data will be printed.
+    def iter_plogs(self, directory=None, recursive=True, categories=None, since=None, until=None):
+        """
+        Finds plogs, yielding them as they are found in the index or in the directory
+        :param directory: where to look for plogs, defaults to self.location
+        :param recursive: whether to look in every folder of the directory
+        :param categories: names of categories to yield plogs of, None for all
+        :param since: timestamp, only plogs created since then
+        :param until: timestamp, only plogs created until then
+        :return: generator of Plog
         """
         if not directory:
             directory = self.location
-        found = []
-        folders = [fdir for fdir in os.listdir(directory) if os.path.isdir(os.path.join(directory, fdir))]
-        for folder in folders:
-            folder_items = os.listdir(os.path.join(directory, folder))
-            if folder == 'templates':
+        found = self._find_indexed_plogs(directory, recursive, since, until)
+        if found is None:
+            found = self._iter_scanned_plogs(directory, recursive)
+        for plog in found:
+            if categories and plog.category not in categories:
+                continue
+            if since is not None and plog.created < since or until is not None and plog.created > until:
                 continue
-            if 'theme.css' in folder_items:
-                found_plogs = self.find_plogs(directory=os.path.join(directory, folder), silent=True)
-                found.append(PlogCategory(name=folder,
-                                          location=os.path.join(directory, folder),
-                                          plog_files=found_plogs))
+            yield plog
 
+    @profiling.timed('find_categories')
+    def find_categories(self, directory=None, pretty_output=False, silent=False, jobs=None, output_format=None,
+                        categories=None, since=None, until=None, sort=None, limit=None):
+        """finds plog categories in a directory
+        :param directory: Plogbook directory, defaults to self.location
+        :param pretty_output: data will be printed in a pretty table.
+        :param silent: no data will be printed.
+        :param jobs: number of threads scanning categories at once, see iter_categories
+        :param output_format: text (default), jsonl, csv or tsv.
+        :param categories: names of categories to list, None for all.
+        :param since: timestamp, only categories created since then.
+        :param until: timestamp, only categories created until then.
+        :param sort: name (default), count or date, prefixed with - for descending order.
+        :param limit: max number of categories.
+        :return: list of categories if silent, otherwise number of printed categories
+        """
+        from plogbook import output
+        found = (cat for cat in self.iter_categories(directory, jobs=jobs)
+                 if (not categories or cat.name in categories) and
+                 (since is None or cat.created >= since) and (until is None or cat.created <= until))
+        found = output.select(found, sort, output.CATEGORY_SORT, limit)
         if silent:
-            return found
+            return list(found)
+        if output_format and output_format != 'text':
+            return output.write_rows(found, output.CATEGORY_FIELDS, output_format)
         if pretty_output:
             print(''.center(65, '-'))
             print('{}|{}|{}'.format('Name'.center(30, ' '), 'Plog Count'.center(15, ' '),
                                     'Creation Date'.center(30, ' ')))
             print(''.center(65, '-'))
+        count = 0
         for f in found:
             print(f.__str__(pretty=pretty_output))
+            count += 1
+        return count
+
+    def iter_categories(self, directory=None, jobs=None, ordered=True):
+        """
+        Finds plog categories in a directory, without the index categories are scanned by a pool of threads so slow
+        storage is waited on for many categories at once
+        :param directory: Plogbook directory, defaults to self.location
+        :param jobs: number of threads scanning categories at once, defaults to SCAN_JOBS
+        :param ordered: yield categories ordered by name, otherwise as soon as each one is scanned
+        :return: generator of PlogCategory
+        """
+        if not directory:
+            directory = self.location
+        if self.index.exists() and os.path.abspath(directory) == self.index.location:
+            for name, location, created, plog_count in self.index.categories():
+                yield PlogCategory(name=name, location=location, plog_count=plog_count, created=created)
+            return
+        entries = sorted((entry for entry in utils.scan_directory(directory) if entry.is_dir()),
+                         key=lambda entry: entry.name)
+        jobs = min(jobs or SCAN_JOBS, len(entries))
+        if jobs <= 1:
+            results = (self._scan_category(directory, entry) for entry in entries)
+            pool = None
+        else:
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(jobs)
+            scan = functools.partial(self._scan_category, directory)
+            results = pool.imap(scan, entries) if ordered else pool.imap_unordered(scan, entries)
+        try:
+            for category in results:
+                if category is not None:
+                    yield category
+        finally:
+            if pool:
+                pool.terminate()
+                pool.join()
+
+    @staticmethod
+    def _scan_category(directory, entry):
+        """
+        Scans a folder of directory for plogs
+        :return: PlogCategory or None if the folder is not a category
+        """
+        if not is_category(directory, entry.name):
+            return None
+        return PlogCategory(name=entry.name, location=entry.path, created=category_created(entry.path,
+                                                                                              entry.stat().st_ctime),
+                            plog_files=PlogBook._scan_plogs(entry.path, recursive=False))
+
+    @staticmethod
+    def _scan_plogs(directory, recursive):
+        """
+        Finds plogs of a directory by walking the filesystem
+        :return: list of plogs
+        """
+        return list(PlogBook._iter_scanned_plogs(directory, recursive))
+
+    @staticmethod
+    def _iter_scanned_plogs(directory, recursive):
+        """
+        Walks the filesystem for plogs of a directory, yielding them folder by folder
+        """
+        directories = [directory]
+        while directories:
+            folder = directories.pop()
+            entries = utils.scan_directory(folder)
+            # when walking recursively only categories, folders with a category marker, have plogs
+            has_plogs = not recursive or any(entry.name in CATEGORY_MARKERS for entry in entries)
+            titles = set()
+            for entry in entries:
+                if recursive and entry.is_dir():
+                    directories.append(entry.path)
+                elif has_plogs and fnmatch.fnmatch(entry.name, '*.html') and not is_page(entry.name):
+                    titles.add(entry.name)
+                    yield Plog(location=entry.path, title=entry.name, entry=entry)
+            if has_plogs and any(entry.name == ARCHIVE_INDEX for entry in entries):
+                category = os.path.basename(folder)
+                for location, title, created, _ in archived_plogs(folder, exclude=titles):
+                    yield Plog(location=location, category=category, title=title, created=created)
+
+    def _find_indexed_plogs(self, directory, recursive, since=None, until=None):
+        """
+        Finds plogs of a directory in the index, plogs created in since-until range are looked up by their date
+        :return: generator of plogs or None if directory is not covered by the index
+        """
+        if not self.index.exists():
+            return None
+        if os.path.abspath(directory) == self.index.location:
+            if not recursive:  # plogs only live in categories
+                return None
+            rows = self.index.plogs(since=since, until=until)
+        else:
+            category = self.index.category(directory)
+            if category is None:
+                return None
+            rows = self.index.plogs(category, since, until)
+        return (Plog(location=location, category=category, title=title, created=created)
+                for location, category, title, created in rows)
+
+    def reindex(self):
+        """
+        Reconciles Plogbook index with the files, only categories with changed directories are rescanned.
+        """
+        changed = self.index.reindex()
+        print('reindexed {} categories{}'.format(len(changed), ': ' + ', '.join(sorted(changed)) if changed else ''))
+        return changed
+
+    def search(self, query, categories=None, since=None, until=None, limit=20, pretty_output=False, silent=False):
+        """
+        Finds plogs by their content, title and category ranked by relevance.
+        :param query: search terms.
+        :param categories: list of category names to search in, None for all.
+        :param since: timestamp, only plogs created since then.
+        :param until: timestamp, only plogs created until then.
+        :param limit: max number of results.
+        :param pretty_output: data will be printed in a pretty table.
+        :param silent: no data will be printed.
+        :return: list of (score, plog) tuples, best match first
+        """
+        if not self.index.exists():
+            print('Plogbook has no index yet, run --reindex first')
+            return []
+        found = [(score, Plog(location=location, category=category, title=title, created=created))
+                 for score, location, category, title, created in
+                 self.index.search(query, categories=categories, since=since, until=until, limit=limit)]
+
+        if silent:
+            return found
+        if pretty_output:
+            print(''.center(154, '-'))
+            print('{}|{}|{}|{}|{}'.format('Score'.center(8, ' '), 'Location'.ljust(80, ' '), 'Category'.center(20, ' '),
+                                          'Title'.center(20, ' '), 'Date'.center(20, ' ')))
+            print(''.center(154, '-'))
+        for score, plog in found:
+            if pretty_output:
+                print(u'{:^8.2f}|{}'.format(score, plog.__str__(pretty=True)))
+            else:
+                print(u'{:.2f};{}'.format(score, plog))
         return found
 
 
-class PlogCategory:
+class PlogCategory(object):
     """
     Storage and management class for plog category.
     """
+    __slots__ = ('name', 'location', '_plog_files', '_plog_count', '_created', '_entry')
 
-    def __init__(self, name, location, plog_files=None):
+    def __init__(self, name, location, plog_files=None, plog_count=None, created=None, entry=None):
         """
         :param name: category name.
         :param location: location of the category on the hard-drive.
-        :param plog_files: list of plog_file the category contains. If None will find plogs itself in "location".
-        :return:
+        :param plog_files: list of plog_file the category contains. If None will find plogs itself in "location"
+        when they are first needed.
+        :param plog_count: amount of plogs in the category, used instead of plog_files i.e. when taken from index.
+        :param created: creation timestamp, if not provided will be taken from the category marker or the folder.
+        :param entry: directory entry of the category folder from utils.scan_directory, its cached stat is used
         """
         self.name = name
         self.location = location
-        self.plog_files = plog_files or PlogBook.find_plogs(location)
-        self.plog_count = len(self.plog_files)
-        self.creation_date = self.get_date()
+        self._plog_files = plog_files
+        self._plog_count = plog_count
+        self._created = created
+        self._entry = entry
+
+    @property
+    def plog_files(self):
+        """plogs of the category"""
+        if self._plog_files is None:
+            self._plog_files = PlogBook._scan_plogs(self.location, recursive=False)
+        return self._plog_files
+
+    @property
+    def plog_count(self):
+        if self._plog_count is None:
+            self._plog_count = len(self.plog_files)
+        return self._plog_count
+
+    @property
+    def created(self):
+        """creation timestamp of the category"""
+        if self._created is None:
+            meta = self._entry.stat() if self._entry is not None else os.stat(self.location)
+            self._created = category_created(self.location, meta.st_ctime)
+            self._entry = None
+        return self._created
+
+    @property
+    def creation_date(self):
+        """creation date formatted for display"""
+        return self.get_date(self.created)
 
-    def get_date(self):
+    def get_date(self, timestamp=None):
         """finds the date when category was created"""
-        meta = os.stat(self.location)
-        date = meta.st_ctime
+        date = timestamp
+        if date is None:
+            date = self.created
         date = datetime.fromtimestamp(date)
         date = date.strftime('%x %X')
         return date
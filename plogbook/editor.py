@@ -0,0 +1,108 @@
+"""
+Capturing of plog messages through a text editor.
+Every session edits its own draft in <Plogbook>/.plogbook/drafts/ so several plogs can be written at once and a
+draft survives a crash. Terminal editors are waited for until they exit, known editors that detach from the terminal
+(i.e. GUI editors started without their wait flag) are waited for by watching the draft for saves.
+"""
+from __future__ import print_function
+import os
+import time
+import shlex
+import tempfile
+import subprocess
+
+DETACH_TIME = 1.0  # detaching editors exiting faster than this without touching the draft are waited for
+# editors that return right away unless they are started with one of WAIT_FLAGS
+DETACHING_EDITORS = ('atom', 'code', 'gvim', 'mate', 'mvim', 'open', 'subl')
+WAIT_FLAGS = ('-f', '-W', '-w', '--nofork', '--wait')
+SETTLE_TIME = 1.5  # seconds without saves after which a detached editor's draft is taken as done
+MAX_BACKOFF = 2.0  # max seconds between checks of a draft while waiting for a detached editor
+
+
+def is_detaching(command):
+    """
+    :param command: editor command split into arguments
+    :return: whether the editor is known to return before editing is done
+    """
+    name = os.path.splitext(os.path.basename(command[0]))[0].lower() if command else ''
+    return name in DETACHING_EDITORS and not any(argument in WAIT_FLAGS for argument in command[1:])
+
+
+class EditorSession:
+    """
+    Single draft being edited in an external editor.
+    """
+
+    def __init__(self, editor, drafts_directory, initial='', detached=None):
+        """
+        :param editor: editor command, may include arguments i.e. "code --wait"
+        :param drafts_directory: where the draft is kept while it's being edited
+        :param initial: initial content of the draft
+        :param detached: whether the editor returns before editing is done, None guesses it from the command, see
+        is_detaching
+        """
+        self.editor = editor
+        self.command = shlex.split(editor, posix=os.name != 'nt')
+        self.detached = is_detaching(self.command) if detached is None else detached
+        if not os.path.exists(drafts_directory):
+            os.makedirs(drafts_directory)
+        handle, self.location = tempfile.mkstemp(dir=drafts_directory, prefix='draft-', suffix='.txt')
+        with os.fdopen(handle, 'w') as draft:
+            draft.write(initial)
+        self.initial = initial
+
+    def _mtime(self):
+        try:
+            return os.stat(self.location).st_mtime
+        except OSError:  # editors that save by replacing the file can leave it missing for a moment
+            return None
+
+    def _read(self):
+        with open(self.location) as draft:
+            return draft.read()
+
+    def edit(self, timeout=None):
+        """
+        Opens the draft in the editor and waits until editing is done
+        :param timeout: max seconds to wait for a detached editor, None to wait forever
+        :return: edited message or None if the draft was left empty or unchanged
+        """
+        mtime = self._mtime()
+        started = time.time()
+        subprocess.Popen(self.command + [self.location]).wait()
+        if self.detached and time.time() - started < DETACH_TIME and self._mtime() == mtime:
+            print('<Editor runs in the background, save the draft to finish: {}>'.format(self.location))
+            self.wait_for_save(mtime, timeout)
+        msg = self._read()
+        if not msg.strip() or msg == self.initial:
+            return None
+        return msg
+
+    def wait_for_save(self, mtime, timeout=None):
+        """
+        Sleeps until the draft is saved and then until saves stop for SETTLE_TIME, checks of the draft back off
+        exponentially so waiting costs next to no cpu
+        :param mtime: mtime of the draft before editing
+        :param timeout: max seconds to wait for the first save, None to wait forever
+        :return: whether the draft was saved
+        """
+        started = time.time()
+        delay = 0.1
+        while self._mtime() == mtime:
+            if timeout is not None and time.time() - started > timeout:
+                return False
+            time.sleep(delay)
+            delay = min(delay * 2, MAX_BACKOFF)
+        saved = self._mtime()
+        while True:
+            time.sleep(SETTLE_TIME)
+            current = self._mtime()
+            if current == saved:
+                return True
+            saved = current
+
+    def close(self):
+        """Removes the draft, call it once the plog is written"""
+        if os.path.exists(self.location):
+            os.remove(self.location)
+
@@ -0,0 +1,190 @@
+"""
+Localization of images found in plog html.
+Images are downloaded concurrently, streamed to disk and stored once per content in a shared cache from where they
+are linked to the category images/ folder.
+"""
+from __future__ import print_function
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+from multiprocessing.pool import ThreadPool
+
+try:
+    from urllib.request import urlopen
+    from urllib.parse import urlparse
+except ImportError:
+    from urllib2 import urlopen
+    from urlparse import urlparse
+
+from plogbook import profiling, utils
+
+IMG_SRC = re.compile('img.*?src="(.*?)"')
+CHUNK_SIZE = 64 * 1024
+URLS_FILE = 'urls.json'
+
+
+class ImageCache:
+    """
+    Content addressed storage of downloaded images.
+    Images are stored as <sha1 of content><extension> and urls.json maps downloaded urls to them.
+    """
+
+    def __init__(self, location, timeout=10, retries=2):
+        """
+        :param location: directory of the cache
+        :param timeout: seconds to wait for a server to respond
+        :param retries: how many times to retry a failed download
+        """
+        self.location = location
+        self.timeout = timeout
+        self.retries = retries
+        if not os.path.exists(location):
+            os.makedirs(location)
+        self.urls = self._read_urls()
+
+    def _read_urls(self):
+        try:
+            with open(os.path.join(self.location, URLS_FILE)) as urls_file:
+                return json.load(urls_file)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def save(self):
+        """Persists url mapping of the cache, atomically as caches can be shared by processes"""
+        utils.write_file(os.path.join(self.location, URLS_FILE), json.dumps(self.urls))
+
+    def get(self, url):
+        """
+        :return: file name of the cached image of url or None if it's not cached
+        """
+        name = self.urls.get(url)
+        if name and os.path.exists(os.path.join(self.location, name)):
+            return name
+        return None
+
+    def fetch(self, url):
+        """
+        Downloads url to the cache unless it's already there
+        :return: file name of the cached image or None if download failed
+        """
+        name = self.get(url)
+        if name:
+            return name
+        for attempt in range(self.retries + 1):
+            try:
+                name = self._download(url)
+                break
+            except ValueError as e:  # not a downloadable url
+                print('failed to download image {}: {}'.format(url, e))
+                return None
+            except (IOError, OSError) as e:  # URLError and timeouts are IOErrors too
+                if attempt == self.retries or getattr(e, 'code', 500) < 500:  # client errors won't go away
+                    print('failed to download image {}: {}'.format(url, e))
+                    return None
+                time.sleep(0.5 * 2 ** attempt)
+        self.urls[url] = name
+        return name
+
+    def _download(self, url):
+        """Streams url to a temporary file while hashing it and moves it to it's content addressed name"""
+        digest = hashlib.sha1()
+        extension = os.path.splitext(urlparse(url).path)[1]
+        if not re.match(r'^\.\w{1,5}$', extension):
+            extension = ''
+        handle, temp_location = tempfile.mkstemp(dir=self.location, suffix='.part')
+        try:
+            with os.fdopen(handle, 'wb') as temp_file:  # closed even when the request fails
+                response = urlopen(url, timeout=self.timeout)
+                try:
+                    while True:
+                        chunk = response.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        profiling.count('network_bytes', len(chunk))
+                        profiling.count('bytes_written', len(chunk))
+                        digest.update(chunk)
+                        temp_file.write(chunk)
+                finally:
+                    response.close()
+            name = digest.hexdigest() + extension.lower()
+            location = os.path.join(self.location, name)
+            if os.path.exists(location):  # same content from another url
+                os.remove(temp_location)
+            else:
+                os.rename(temp_location, location)
+            return name
+        except BaseException:
+            if os.path.exists(temp_location):
+                os.remove(temp_location)
+            raise
+
+    def copy_to(self, name, directory):
+        """
+        Places cached image into directory, hard linking it when possible
+        """
+        target = os.path.join(directory, name)
+        if os.path.exists(target):
+            return
+        try:
+            os.link(os.path.join(self.location, name), target)
+        except (OSError, AttributeError):
+            shutil.copyfile(os.path.join(self.location, name), target)
+
+
+def legacy_name(src):
+    """Name of localized image as it was stored before the image cache existed"""
+    return ''.join(re.findall(r'(\w+|\.)', src))
+
+
+def local_legacy_name(src, image_location):
+    """:return: legacy name of the image if it was localized to image_location before, otherwise None"""
+    name = legacy_name(src)
+    if name and os.path.exists(os.path.join(image_location, name)):
+        return name
+    return None
+
+
+def localize_images(html, save_directory, cache_directory=None, download=True, jobs=8):
+    """
+    Downloads images found in @src of img tags and points @src to the local copies in save_directory/images/
+    :param html: html string
+    :param save_directory: directory where html file will be saved
+    :param cache_directory: directory of the shared image cache, defaults to save_directory/images
+    :param download: whether to download images that are not in the cache, otherwise @src is pointed to already
+    localized images only
+    :param jobs: max number of concurrent downloads
+    :return: updated html string
+    """
+    image_location = os.path.join(save_directory, 'images')
+    if not os.path.exists(image_location):
+        os.makedirs(image_location)
+    cache = ImageCache(cache_directory or image_location)
+    sources = []
+    for src in IMG_SRC.findall(html):
+        if src not in sources and not src.startswith('images/'):
+            sources.append(src)
+    if not sources:
+        return html
+
+    if download:
+        pool = ThreadPool(min(jobs, len(sources)))
+        try:
+            names = pool.map(cache.fetch, sources)
+        finally:
+            pool.close()
+            pool.join()
+        cache.save()
+    else:
+        names = [cache.get(src) or local_legacy_name(src, image_location) for src in sources]
+
+    for src, name in zip(sources, names):
+        if not name:  # failed download, keep the remote image
+            continue
+        if download:
+            cache.copy_to(name, image_location)
+        html = html.replace('src="{}"'.format(src), 'src="images/{}"'.format(name))
+    return html
@@ -0,0 +1,214 @@
+"""
+Bulk import of existing notes into the Plogbook.
+Records are streamed from a folder of text/markdown notes or a JSONL export, rendered into plogs on worker processes
+and the category and main pages are written once at the end.
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import itertools
+import multiprocessing
+from datetime import datetime
+
+from plogbook import utils
+from plogbook.index import is_page, is_valid_category, INDEX_DIR
+from plogbook.plog import write_source, source_digest
+
+NOTE_EXTENSIONS = ('.txt', '.text')
+MARKDOWN_EXTENSIONS = ('.md', '.markdown', '.mdown')
+BATCH_SIZE = 256  # records rendered per batch, bounds memory of streamed records
+
+# PlogBook of the worker process
+_book = None
+
+
+def read_directory(location):
+    """
+    Reads notes from a folder, sub folders become categories and notes directly in it go to a category named
+    after the folder
+    :param location: folder of .txt and .md notes
+    :return: generator of records
+    """
+    location = os.path.abspath(location)
+    for root, dirnames, filenames in os.walk(location):
+        dirnames[:] = sorted(name for name in dirnames if not name.startswith('.'))
+        category = os.path.basename(root) if root == location else os.path.relpath(root, location).split(os.sep)[0]
+        for filename in sorted(filenames):
+            title, extension = os.path.splitext(filename)
+            extension = extension.lower()
+            if extension not in NOTE_EXTENSIONS + MARKDOWN_EXTENSIONS:
+                continue
+            path = os.path.join(root, filename)
+            with open(path) as note:
+                msg = note.read()
+            yield {'category': category, 'title': title, 'msg': msg, 'created': os.stat(path).st_mtime,
+                   'markdown': extension in MARKDOWN_EXTENSIONS}
+
+
+def read_jsonl(location):
+    """
+    Reads records from a JSONL file, one json object per line with "category", "title" and "msg" (or "message")
+    keys and optional "created" (timestamp or YYYY-MM-DD["HH:MM"]), "markdown" and "localize_img" keys
+    :return: generator of records
+    """
+    with open(location) as jsonl:
+        for number, line in enumerate(jsonl, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if 'msg' not in record:
+                record['msg'] = record.pop('message', '')
+            if not record.get('category') or not record.get('title'):
+                print('skipping line {}: record needs "category" and "title"'.format(number))
+                continue
+            yield record
+
+
+def read_records(location):
+    """
+    :param location: folder of notes or .jsonl file
+    :return: generator of records
+    """
+    if os.path.isdir(location):
+        return read_directory(location)
+    return read_jsonl(location)
+
+
+def _init_worker(location):
+    global _book
+    from plogbook.book import PlogBook
+    _book = PlogBook(location=location)
+
+
+def _write_plog(record):
+    return write_record(_book, record)
+
+
+def write_record(book, record):
+    """
+    Writes plog of a record without updating the pages and the index
+    :param book: PlogBook to write to
+    :param record: dict with category, title and msg keys and optional created, markdown and localize_img keys
+    :return: location of the written plog or None if it already exists or the record is invalid
+    """
+    category, title = record['category'], record['title']
+    if not is_valid_category(category) or os.sep in title:
+        print('\nskipping {}/{}: not a valid category or title'.format(category, title))
+        return None
+    if is_page(title + '.html'):  # don't let generated pages overwrite the plog
+        title += '_'
+    save_directory = os.path.join(book.location, category)
+    file_name = os.path.join(save_directory, title + '.html')
+    if os.path.exists(file_name):
+        return None
+    created = created_timestamp(record.get('created'))
+    date = datetime.fromtimestamp(created).strftime('%x-%X')
+    msg = source = record['msg']
+    markdown = bool(record.get('markdown')) and book.converter is not None
+    if markdown:
+        msg = book.markdown(msg)
+    if not os.path.exists(save_directory):
+        try:
+            os.makedirs(save_directory)
+        except OSError:  # made by another worker meanwhile
+            pass
+    if record.get('localize_img'):
+        msg = book.convert_html(msg, save_directory=save_directory, localize_img=True,
+                                cache_directory=os.path.join(book.location, INDEX_DIR, 'images'))
+    with utils.atomic_file(file_name) as html_file:
+        book.write_log_html(html_file.write, msg=msg, cat=category, title=title, date=date, created=created,
+                            source=source_digest(source))
+    write_source(file_name, source, category=category, title=title, date=date, created=created,
+                 markdown=markdown, localize_img=bool(record.get('localize_img')))
+    os.utime(file_name, (created, created))
+    return file_name
+
+
+def add_plogs(book, records, jobs=None, markdown=False, localize_img=False):
+    """
+    Writes plogs from records and updates the pages of their categories and the main page once at the end.
+    Plogs that already exist are skipped so an interrupted import can be run again.
+    :param book: PlogBook to add to
+    :param records: iterable of dicts with category, title and msg keys and optional created, markdown and
+    localize_img keys
+    :param jobs: number of worker processes, defaults to cpu count, 1 renders in the current process
+    :param markdown: convert every message from markdown, otherwise only the records marked so
+    :param localize_img: localize images of every message, otherwise only of the records marked so
+    :return: list of locations of written plogs
+    """
+    global _book
+    jobs = jobs or multiprocessing.cpu_count()
+    if markdown or localize_img:
+        records = (dict(record, markdown=record.get('markdown') or markdown,
+                        localize_img=record.get('localize_img') or localize_img) for record in records)
+    if book.converter is None:
+        records = _warn_markdown(records)
+    pool = None
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(book.location,))
+    else:
+        _book = book
+    written = []
+    skipped = 0
+    try:
+        records = iter(records)
+        while True:
+            batch = list(itertools.islice(records, BATCH_SIZE))
+            if not batch:
+                break
+            results = pool.imap_unordered(_write_plog, batch, max(1, len(batch) // (jobs * 4))) if pool \
+                else (_write_plog(record) for record in batch)
+            for location in results:
+                if location:
+                    written.append(location)
+                else:
+                    skipped += 1
+            print('\rimporting plogs: {}'.format(len(written) + skipped), end='')
+            sys.stdout.flush()
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    print()
+
+    categories = sorted(set(os.path.dirname(location) for location in written))
+    for category in categories:  # marker makes the folder a category so it goes first
+        book.mark_category(category)
+        book.ensure_theme(category)
+    book.ensure_theme()
+    book.index.reindex()
+    for category in categories:
+        book.write_cat_html(category)
+        book.index.touch_category(os.path.basename(category))
+    book.write_main_html()
+    book.write_date_pages()
+    book.write_feed()
+    print('imported {} plogs into {} categories{}'.format(
+        len(written), len(categories), ', skipped {} existing'.format(skipped) if skipped else ''))
+    return written
+
+
+def _warn_markdown(records):
+    """Passes records through, warning once that markdown ones won't be converted"""
+    warned = False
+    for record in records:
+        if record.get('markdown') and not warned:
+            print('You need to install package "markdown2" for markdown conversion support, '
+                  'markdown notes are imported as they are')
+            warned = True
+        yield record
+
+
+def created_timestamp(created):
+    """
+    :param created: timestamp, YYYY-MM-DD["HH:MM"] date or None for now
+    :return: timestamp
+    """
+    if created is None:
+        return time.time()
+    try:
+        return float(created)
+    except ValueError:
+        return utils.parse_date(created)
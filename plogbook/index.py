@@ -0,0 +1,453 @@
+"""
+Persistent index of the Plogbook categories and plogs.
+The index lives in <Plogbook>/.plogbook/index.db and lets listings avoid walking the whole Plogbook.
+"""
+import os
+import re
+import json
+import fnmatch
+
+from plogbook import utils
+from plogbook.plog import plog_created
+from plogbook.archive import INDEX_FILE as ARCHIVE_INDEX, archived_plogs
+
+INDEX_DIR = '.plogbook'
+INDEX_FILE = 'index.db'
+SCHEMA_VERSION = 4  # index is rebuilt from scratch when it was made with a different schema
+MAIN_PAGE = ''  # items page name of the Plogbook main page, other pages are named by category
+# generated pages: main.html, numbered pages and static archive-<n>.html pages of archived plogs
+PAGE_FILE = re.compile(r'^(main|page-\d+|archive-\d+)\.html$')
+DATES_DIR = 'dates'  # folder of the Plogbook with pages of plogs by their date
+ASSETS_DIR = 'assets'  # folder of the Plogbook with assets shared by every page, i.e. the theme
+# folders of the Plogbook that plogs can't be written to
+RESERVED_NAMES = ('templates', ASSETS_DIR, DATES_DIR)
+CATEGORY_FILE = '.category'  # marks folders that are categories
+# files that mark a category, Plogbooks written before the marker marked categories by their theme.css
+CATEGORY_MARKERS = (CATEGORY_FILE, 'theme.css')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS categories (
+    name TEXT PRIMARY KEY,
+    location TEXT NOT NULL,
+    created REAL NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS plogs (
+    location TEXT PRIMARY KEY,
+    category TEXT NOT NULL,
+    title TEXT NOT NULL,
+    created REAL NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS plogs_category ON plogs (category, created);
+CREATE INDEX IF NOT EXISTS plogs_created ON plogs (created);
+CREATE TABLE IF NOT EXISTS items (
+    page TEXT NOT NULL,
+    key TEXT NOT NULL,
+    sort_key REAL NOT NULL,
+    template TEXT NOT NULL,
+    html TEXT NOT NULL,
+    PRIMARY KEY (page, key)
+);
+CREATE INDEX IF NOT EXISTS items_order ON items (page, template, sort_key, key);
+CREATE TABLE IF NOT EXISTS stale (
+    page TEXT PRIMARY KEY,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    page TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (page, number)
+);
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    location TEXT NOT NULL UNIQUE,
+    length INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    document INTEGER NOT NULL,
+    frequency INTEGER NOT NULL,
+    PRIMARY KEY (term, document)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_document ON postings (document);
+"""
+
+
+def is_page(filename):
+    """Whether file is a generated page (main.html or page-<n>.html) rather than a plog"""
+    return PAGE_FILE.match(filename) is not None
+
+
+def is_valid_category(name):
+    """Whether plogs can be written to a category of this name, it can't clash with folders Plogbook writes itself"""
+    return bool(name) and os.sep not in name and '/' not in name and not name.startswith('.') and \
+        name not in RESERVED_NAMES
+
+
+def is_category(directory, name):
+    """
+    Whether folder name in directory is a plog category
+    :param directory: Plogbook directory
+    :param name: folder name
+    """
+    if name == 'templates' or name.startswith('.'):
+        return False
+    return any(os.path.exists(os.path.join(directory, name, marker)) for marker in CATEGORY_MARKERS)
+
+
+def category_created(location, ctime=None):
+    """
+    :param location: location of the category
+    :param ctime: ctime of the category folder if it's known already
+    :return: creation timestamp from the category marker, ctime of the folder for categories marked without it
+    """
+    try:
+        with open(os.path.join(location, CATEGORY_FILE)) as marker:
+            return float(json.load(marker)['created'])
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        return ctime if ctime is not None else os.stat(location).st_ctime
+
+
+def scan_category(location):
+    """
+    Scans category folder for plogs
+    :param location: location of the category
+    :return: list of (location, title, ctime, mtime) tuples, archived plogs have their creation time as ctime
+    """
+    found = []
+    archived = False
+    for entry in utils.scan_directory(location):
+        if entry.name == ARCHIVE_INDEX:
+            archived = True
+        if not fnmatch.fnmatch(entry.name, '*.html') or is_page(entry.name):
+            continue
+        meta = entry.stat()
+        found.append((entry.path, entry.name, meta.st_ctime, meta.st_mtime))
+    if archived:
+        found.extend(archived_plogs(location, exclude=set(title for _, title, _, _ in found)))
+    return found
+
+
+class PlogIndex:
+    """
+    Manifest of categories and plogs of a Plogbook stored in sqlite database.
+    The index is only created on demand (i.e. by writing a plog or --reindex) so listing folders that are not
+    Plogbooks leaves no trace.
+    """
+
+    def __init__(self, location):
+        """
+        :param location: location of the Plogbook
+        """
+        self.location = os.path.abspath(location)
+        self.path = os.path.join(self.location, INDEX_DIR, INDEX_FILE)
+        self._db = None
+
+    def exists(self):
+        """Whether the index was created for this Plogbook"""
+        return self._db is not None or os.path.exists(self.path)
+
+    @property
+    def db(self):
+        """Connection to index database, creates and fills the index if it doesn't exist yet"""
+        if self._db is None:
+            is_new = not os.path.exists(self.path)
+            if is_new and not os.path.exists(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            import sqlite3
+            self._db = sqlite3.connect(self.path, timeout=30)
+            self._db.execute('PRAGMA cache_size = -65536')
+            if self._db.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+                tables = self._db.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+                for table in tables:
+                    self._db.execute('DROP TABLE {}'.format(table[0]))
+                self._db.execute('PRAGMA user_version = {}'.format(SCHEMA_VERSION))
+                is_new = True
+            self._db.executescript(SCHEMA)
+            if is_new:
+                self.reindex(full=True)
+        return self._db
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def reindex(self, full=False, rescan=()):
+        """
+        Reconciles the index with the filesystem.
+        Only categories whose directory mtime changed are rescanned unless full is True.
+        :param full: rescan every category.
+        :param rescan: names of categories to rescan even if their directory mtime didn't change, i.e. a plog was edited
+        :return: list of category names that were rescanned or removed.
+        """
+        db = self.db
+        known = dict(db.execute('SELECT name, mtime FROM categories'))
+        changed = []
+        seen = set()
+        for entry in utils.scan_directory(self.location):
+            name, location = entry.name, entry.path
+            if not entry.is_dir() or not is_category(self.location, name):
+                continue
+            seen.add(name)
+            meta = entry.stat()
+            if not full and name not in rescan and known.get(name) == meta.st_mtime:
+                continue
+            changed.append(name)
+            self._clear_items(name)
+            self._scan_category(name, location, full)
+            db.execute('INSERT OR REPLACE INTO categories VALUES (?, ?, ?, ?)',
+                       (name, location, category_created(location, meta.st_ctime), meta.st_mtime))
+        for name in set(known) - seen:
+            changed.append(name)
+            self._clear_items(name)
+            for plog in db.execute('SELECT location FROM plogs WHERE category = ?', (name,)).fetchall():
+                self._remove_document(plog[0])
+            db.execute('DELETE FROM plogs WHERE category = ?', (name,))
+            db.execute('DELETE FROM categories WHERE name = ?', (name,))
+        db.commit()
+        return changed
+
+    def _scan_category(self, category, location, full=False):
+        """
+        Updates plogs of a category, only new and modified plogs are added to the search index unless full is True
+        """
+        db = self.db
+        previous = dict(db.execute('SELECT location, mtime FROM plogs WHERE category = ?', (category,)))
+        for plog_location, title, ctime, mtime in scan_category(location):
+            if previous.pop(plog_location, None) == mtime and not full:
+                continue
+            created = plog_created(plog_location, ctime)  # only header of the plog is read
+            db.execute('INSERT OR REPLACE INTO plogs VALUES (?, ?, ?, ?, ?)',
+                       (plog_location, category, title, created, mtime))
+            self._add_document(plog_location, category, title)
+        for plog_location in previous:
+            db.execute('DELETE FROM plogs WHERE location = ?', (plog_location,))
+            self._remove_document(plog_location)
+
+    def _add_document(self, location, category, title):
+        """Adds plog to the search index, replacing it if it's already there"""
+        from plogbook import search
+        terms = search.document_terms(location, category, title)
+        self._remove_document(location)
+        document = self.db.execute('INSERT INTO documents (location, length) VALUES (?, ?)',
+                                   (location, sum(terms.values()))).lastrowid
+        self.db.executemany('INSERT INTO postings VALUES (?, ?, ?)',
+                            [(term, document, frequency) for term, frequency in terms.items()])
+
+    def _remove_document(self, location):
+        """Removes plog from the search index"""
+        row = self.db.execute('SELECT id FROM documents WHERE location = ?', (location,)).fetchone()
+        if row:
+            self.db.execute('DELETE FROM postings WHERE document = ?', row)
+            self.db.execute('DELETE FROM documents WHERE id = ?', row)
+
+    def add_plog(self, location):
+        """
+        Records newly written plog and updates it's category
+        :param location: location of the plog, it's parent folder is the category
+        """
+        is_new = not self.exists()
+        db = self.db
+        if is_new:  # new index already scanned the plog
+            return
+        location = os.path.abspath(location)
+        category_location = os.path.dirname(location)
+        category = os.path.basename(category_location)
+        if os.path.dirname(category_location) != self.location:  # only top level folders are categories
+            return
+        plog_meta = os.stat(location)
+        category_meta = os.stat(category_location)
+        db.execute('INSERT OR REPLACE INTO plogs VALUES (?, ?, ?, ?, ?)',
+                   (location, category, os.path.basename(location), plog_created(location, plog_meta.st_ctime),
+                    plog_meta.st_mtime))
+        self._add_document(location, category, os.path.basename(location))
+        db.execute('INSERT OR REPLACE INTO categories VALUES (?, ?, ?, ?)',
+                   (category, category_location, category_created(category_location, category_meta.st_ctime),
+                    category_meta.st_mtime))
+        db.commit()
+
+    def touch_category(self, name):
+        """
+        Records current mtime of category directory so files written by Plogbook itself, i.e. new pages, don't make
+        the next reindex rescan it
+        """
+        location = os.path.join(self.location, name)
+        self.db.execute('UPDATE categories SET mtime = ? WHERE name = ?', (os.stat(location).st_mtime, name))
+        self.db.commit()
+
+    def categories(self, name=None):
+        """
+        :param name: category name, None for all categories
+        :return: list of (name, location, created, plog count) tuples
+        """
+        query = ('SELECT c.name, c.location, c.created, COUNT(p.location) FROM categories c '
+                 'LEFT JOIN plogs p ON p.category = c.name {} GROUP BY c.name')
+        if name is None:
+            return self.db.execute(query.format('')).fetchall()
+        return self.db.execute(query.format('WHERE c.name = ?'), (name,)).fetchall()
+
+    def category(self, location):
+        """
+        :param location: location of a directory
+        :return: category name if location is an indexed category otherwise None
+        """
+        location = os.path.abspath(location)
+        if os.path.dirname(location) != self.location:
+            return None
+        row = self.db.execute('SELECT name FROM categories WHERE name = ?', (os.path.basename(location),)).fetchone()
+        return row[0] if row else None
+
+    def plogs(self, category=None, since=None, until=None):
+        """
+        :param category: category name, None for plogs of all categories
+        :param since: timestamp, only plogs created since then
+        :param until: timestamp, only plogs created until then
+        :return: iterable of (location, category, title, created) tuples, rows are fetched as they are iterated
+        """
+        conditions = []
+        params = []
+        for condition, param in (('category = ?', category), ('created >= ?', since), ('created <= ?', until)):
+            if param is not None:
+                conditions.append(condition)
+                params.append(param)
+        where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+        return self.db.execute('SELECT location, category, title, created FROM plogs' + where, params)
+
+    def newest_plogs(self, limit):
+        """
+        :param limit: number of plogs
+        :return: list of (location, category, title, created) tuples of the newest plogs, only limit rows of the created
+        index are read
+        """
+        return self.db.execute('SELECT location, category, title, created FROM plogs ORDER BY created DESC, location '
+                               'LIMIT ?', (limit,)).fetchall()
+
+    def search(self, query, categories=None, since=None, until=None, limit=20):
+        """
+        Full-text search, see plogbook.search.search
+        :return: list of (score, location, category, title, created) tuples, best match first
+        """
+        from plogbook import search
+        return search.search(self.db, query, categories=categories, since=since, until=until, limit=limit)
+
+    def items_count(self, page, template):
+        """
+        :param page: category name or MAIN_PAGE
+        :param template: fingerprint of the item template the items were rendered with
+        :return: number of rendered items of a page
+        """
+        return self.db.execute('SELECT COUNT(*) FROM items WHERE page = ? AND template = ?',
+                               (page, template)).fetchone()[0]
+
+    def items_cached(self, page, template):
+        """
+        Whether rendered items cover the whole page
+        :param page: category name or MAIN_PAGE
+        :param template: fingerprint of the item template the items were rendered with
+        """
+        if page == MAIN_PAGE:
+            expected = self.db.execute('SELECT COUNT(*) FROM categories').fetchone()[0]
+        else:
+            expected = self.db.execute('SELECT COUNT(*) FROM plogs WHERE category = ?', (page,)).fetchone()[0]
+        return self.items_count(page, template) == expected
+
+    def page_items(self, page, template, start=0, stop=None, descending=False):
+        """
+        Rendered items of a page ordered by their sort key
+        :param page: category name or MAIN_PAGE
+        :param template: fingerprint of the item template the items were rendered with
+        :param start: position of the first item
+        :param stop: position after the last item, None for all items
+        :param descending: order from the highest sort key
+        :return: list of rendered items
+        """
+        limit = -1 if stop is None else max(0, stop - start)
+        items = self.db.execute('SELECT html FROM items WHERE page = ? AND template = ? '
+                                'ORDER BY sort_key {}, key LIMIT ? OFFSET ?'.format('DESC' if descending else 'ASC'),
+                                (page, template, limit, start))
+        return [item[0] for item in items]
+
+    def set_page_items(self, page, template, items):
+        """
+        Replaces all rendered items of a page
+        :param page: category name or MAIN_PAGE
+        :param template: fingerprint of the item template
+        :param items: list of (key, sort_key, html) tuples
+        """
+        self.db.execute('DELETE FROM items WHERE page = ?', (page,))
+        self.db.execute('DELETE FROM stale WHERE page = ?', (page,))
+        self.db.executemany('INSERT INTO items VALUES (?, ?, ?, ?, ?)',
+                            [(page, key, sort_key, template, html) for key, sort_key, html in items])
+        self.db.commit()
+
+    def set_page_item(self, page, template, key, sort_key, html):
+        """
+        Adds or replaces single rendered item of a page, lowers the stale position of the page to the item
+        """
+        position = self._item_position(page, template, key, sort_key)
+        old = self.db.execute('SELECT sort_key FROM items WHERE page = ? AND key = ? AND template = ?',
+                              (page, key, template)).fetchone()
+        if old is not None:  # rewritten item moves away from it's old position
+            position = min(position, self._item_position(page, template, key, old[0]))
+        if position < self.stale_position(page):
+            self.db.execute('INSERT OR REPLACE INTO stale VALUES (?, ?)', (page, position))
+        self.db.execute('INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?)', (page, key, sort_key, template, html))
+        self.db.commit()
+
+    def _item_position(self, page, template, key, sort_key):
+        """:return: number of items of a page ordered before the item"""
+        return self.db.execute('SELECT COUNT(*) FROM items WHERE page = ? AND template = ? AND '
+                               '(sort_key < ? OR (sort_key = ? AND key < ?))',
+                               (page, template, sort_key, sort_key, key)).fetchone()[0]
+
+    def stale_position(self, page):
+        """
+        :param page: category name or MAIN_PAGE
+        :return: position of the oldest item that changed since pages were written, 0 if it isn't known
+        """
+        row = self.db.execute('SELECT position FROM stale WHERE page = ?', (page,)).fetchone()
+        return row[0] if row else 0
+
+    def set_stale_position(self, page, position):
+        """Records that items of a page before position are written to it's pages"""
+        self.db.execute('INSERT OR REPLACE INTO stale VALUES (?, ?)', (page, position))
+        self.db.commit()
+
+    def page_digest(self, page, number):
+        """
+        :param page: category name or MAIN_PAGE
+        :param number: page number
+        :return: digest of the page when it was last written or None
+        """
+        row = self.db.execute('SELECT digest FROM pages WHERE page = ? AND number = ?', (page, number)).fetchone()
+        return row[0] if row else None
+
+    def set_page_digest(self, page, number, digest):
+        """Records digest of a written page"""
+        self.db.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?)', (page, number, digest))
+        self.db.commit()
+
+    def setting(self, key, default=None):
+        """
+        :return: value of a Plogbook setting or default if it's not set
+        """
+        row = self.db.execute('SELECT value FROM settings WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_setting(self, key, value):
+        """Remembers a Plogbook setting"""
+        self.db.execute('INSERT OR REPLACE INTO settings VALUES (?, ?)', (key, str(value)))
+        self.db.commit()
+
+    def _clear_items(self, category):
+        """Drops rendered items and pages of a category and the category item of the main page"""
+        self.db.execute('DELETE FROM items WHERE page = ? OR (page = ? AND key = ?)', (category, MAIN_PAGE, category))
+        self.db.execute('DELETE FROM pages WHERE page = ?', (category,))
+        self.db.execute('DELETE FROM stale WHERE page = ?', (category,))
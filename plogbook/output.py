@@ -0,0 +1,75 @@
+"""
+Machine readable output of listings, rows are written as soon as they are found so output can be piped.
+"""
+from __future__ import print_function
+import sys
+import json
+import heapq
+import itertools
+
+FORMATS = ['text', 'jsonl', 'csv', 'tsv']
+# columns of the listings, attribute names of Plog and PlogCategory
+PLOG_FIELDS = ['location', 'category', 'title', 'date', 'created']
+CATEGORY_FIELDS = ['name', 'plog_count', 'creation_date', 'created', 'location']
+# sort keys of the listings: attribute to sort by
+PLOG_SORT = {'date': 'created', 'title': 'title', 'category': 'category', 'location': 'location'}
+CATEGORY_SORT = {'name': 'name', 'count': 'plog_count', 'date': 'created'}
+
+
+def sort_key(sort, keys):
+    """
+    :param sort: name of the sort key, suffixed with :desc (or prefixed with -) for descending order, i.e. date:desc
+    :param keys: dict of sort key names to attributes
+    :return: (key function, reverse)
+    """
+    name, _, order = sort.partition(':')
+    if order not in ('', 'asc', 'desc'):
+        raise ValueError('unknown sort order "{}", expected asc or desc'.format(order))
+    reverse = name.startswith('-') or order == 'desc'
+    name = name.lstrip('-')
+    if name not in keys:
+        raise ValueError('can\'t sort by "{}", expected one of: {}'.format(name, ', '.join(sorted(keys))))
+    attribute = keys[name]
+    return (lambda item: getattr(item, attribute)), reverse
+
+
+def select(items, sort=None, keys=None, limit=None):
+    """
+    Sorts and limits items, when both are given only the top items are kept in a heap of limit size
+    :param items: iterable of items
+    :param sort: sort key name, see sort_key
+    :param keys: dict of sort key names to attributes
+    :param limit: max number of items
+    :return: iterable of items
+    """
+    if not sort:
+        return items if limit is None else itertools.islice(items, limit)
+    key, reverse = sort_key(sort, keys)
+    if limit is None:
+        return sorted(items, key=key, reverse=reverse)
+    return (heapq.nlargest if reverse else heapq.nsmallest)(limit, items, key=key)
+
+
+def write_rows(items, fields, output_format, out=None):
+    """
+    Writes items as rows, one at a time
+    :param items: iterable of objects with fields as attributes
+    :param fields: names of the attributes to write
+    :param output_format: jsonl, csv or tsv
+    :param out: file to write to, defaults to stdout
+    :return: number of written rows
+    """
+    out = out or sys.stdout
+    count = 0
+    if output_format == 'jsonl':
+        for item in items:
+            out.write(json.dumps(dict((field, getattr(item, field)) for field in fields)) + '\n')
+            count += 1
+        return count
+    import csv
+    writer = csv.writer(out, delimiter='\t' if output_format == 'tsv' else ',', lineterminator='\n')
+    writer.writerow(fields)
+    for item in items:
+        writer.writerow([getattr(item, field) for field in fields])
+        count += 1
+    return count
@@ -1,26 +1,192 @@
 from datetime import datetime
+import json
 import os
 
 from plogbook import utils
 
+SOURCE_EXTENSION = '.plog'
+# plog html starts with a line of json metadata in an html comment so listings don't depend on file times
+HEADER_PREFIX = '<!--plog '
+HEADER_SUFFIX = '-->'
+HEADER_SIZE = 4096  # max bytes of the header, only this much of a plog is read to find it
 
 
-class Plog:
+def source_location(location):
+    """
+    :param location: location of the plog .html file
+    :return: location of the plog source file that is stored next to it
+    """
+    return os.path.splitext(location)[0] + SOURCE_EXTENSION
+
+
+def write_source(location, msg, **meta):
+    """
+    Writes plog source next to the plog so it can be re-rendered later.
+    Source file is a line of json metadata followed by the original log message.
+    :param location: location of the plog .html file
+    :param msg: original log message
+    :param meta: metadata of the plog i.e. category, title, date
+    """
+    with utils.atomic_file(source_location(location)) as source_file:
+        source_file.write(json.dumps(meta) + '\n')
+        source_file.write(msg)
+
+
+def open_source(location):
+    """
+    Opens plog source for reading the message in parts, i.e. line by line
+    :param location: location of the plog .html file
+    :return: (metadata dict, file object positioned at the start of the message) or None if plog has no source
+    """
+    try:
+        source_file = open(source_location(location))
+    except (IOError, OSError):
+        source_file = _open_archived(location, source=True)
+        if source_file is None:
+            return None
+    try:
+        return json.loads(source_file.readline()), source_file
+    except ValueError:
+        source_file.close()
+        raise
+
+
+def _open_archived(location, source=False):
+    """
+    :return: text file of archived plog html or source, None if plog isn't archived
+    """
+    from plogbook import archive
+    text = archive.read(location, source=source)
+    if text is None:
+        return None
+    import io
+    return io.StringIO(text)
+
+
+def read_html(location):
+    """
+    :param location: location of the plog .html file, archived plogs are read from their pack
+    :return: html of the plog
+    """
+    try:
+        with open(location) as html_file:
+            return html_file.read()
+    except (IOError, OSError):
+        html_file = _open_archived(location)
+        if html_file is None:
+            raise
+        return html_file.read()
+
+
+def source_digest(msg):
+    """
+    :param msg: original log message string or source file positioned at the message, file is read to the end
+    :return: short hex digest of the message
+    """
+    if not hasattr(msg, 'read'):
+        return utils.fingerprint(msg)
+    import hashlib
+    digest = hashlib.sha1()
+    for chunk in iter(lambda: msg.read(64 * 1024), ''):
+        digest.update(chunk.encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def make_header(category, title, created, source):
+    """
+    :param created: creation timestamp
+    :param source: digest of the original log message, see source_digest
+    :return: metadata header line of plog html
+    """
+    meta = json.dumps({'category': category, 'title': title, 'created': created, 'source': source}, sort_keys=True)
+    return '{}{}{}\n'.format(HEADER_PREFIX, meta.replace('>', '\\u003e'), HEADER_SUFFIX)  # > can't end the comment
+
+
+def read_header(location):
+    """
+    Reads metadata header from the start of plog html, the rest of the file isn't read
+    :param location: location of the plog .html file
+    :return: dict with category, title, created and source keys or None if plog has no header
+    """
+    try:
+        with open(location, 'rb') as plog_file:
+            line = plog_file.readline(HEADER_SIZE).decode('utf-8', 'replace').strip()
+    except (IOError, OSError):
+        html_file = _open_archived(location)
+        if html_file is None:
+            return None
+        line = html_file.readline(HEADER_SIZE).strip()
+    if not line.startswith(HEADER_PREFIX) or not line.endswith(HEADER_SUFFIX):
+        return None
+    try:
+        return json.loads(line[len(HEADER_PREFIX):-len(HEADER_SUFFIX)])
+    except ValueError:
+        return None
+
+
+def plog_created(location, ctime=None):
+    """
+    :param location: location of the plog .html file
+    :param ctime: ctime of the file if it's known already
+    :return: creation timestamp from the header of the plog, ctime of the file for plogs written without header
+    """
+    header = read_header(location)
+    if header and header.get('created') is not None:
+        return float(header['created'])
+    return ctime if ctime is not None else os.stat(location).st_ctime
+
+
+def read_source(location):
+    """
+    :param location: location of the plog .html file
+    :return: (metadata dict, original log message) or None if plog has no source
+    """
+    source = open_source(location)
+    if source is None:
+        return None
+    meta, source_file = source
+    with source_file:
+        return meta, source_file.read()
+
+
+class Plog(object):
     """
     Storage and management class for a plog item.
     plog - is an .html file that is a table and contains title, date, category and log message
     """
+    __slots__ = ('location', 'title', 'category', '_created', '_entry')
 
-    def __init__(self, location, category=None, title=None):
+    def __init__(self, location, category=None, title=None, created=None, entry=None):
         """
         :param location: location of the plog on the hard-drive
         :param category: plog category, if not provided will be extracted from location
         :param title: name of the plog file
+        :param created: creation timestamp, if not provided will be taken from the header of the file when it's first
+        needed
+        :param entry: directory entry of the plog file from utils.scan_directory, its cached stat is used
         """
         self.location = location
-        self.title = title or os.path.split(self.location)[-1]
-        self.category = category or os.path.split(os.path.split(self.location)[0])[-1]
-        self.date = self.get_date()
+        self.title = title or os.path.basename(location)
+        self.category = category or os.path.basename(os.path.dirname(location))
+        self._created = created
+        self._entry = entry
+
+    @property
+    def created(self):
+        """creation timestamp of the plog"""
+        if self._created is None:
+            header = read_header(self.location)
+            if header and header.get('created') is not None:
+                self._created = float(header['created'])
+            else:
+                self._created = (self._entry.stat() if self._entry is not None else os.stat(self.location)).st_ctime
+            self._entry = None
+        return self._created
+
+    @property
+    def date(self):
+        """creation date formatted for display"""
+        return self.get_date(self.created)
 
     def __str__(self, pretty=False):
         if pretty:
@@ -39,10 +205,11 @@ class Plog:
         else:
             return u'{};{};{};{}'.format(self.location, self.category, self.title, self.date)
 
-    def get_date(self):
+    def get_date(self, timestamp=None):
         """finds the date when plog was created"""
-        meta = os.stat(self.location)
-        date = meta.st_ctime
+        date = timestamp
+        if date is None:
+            date = self.created
         date = datetime.fromtimestamp(date)
         date = date.strftime('%x %X')
         return date
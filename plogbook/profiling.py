@@ -0,0 +1,203 @@
+"""
+Per phase timing and io counters of Plogbook commands, reported as JSON by --profile.
+Phases are marked with phase() blocks and the timed() decorator. When no Profiler is running they cost a global
+lookup, stat calls and file writes are only counted while a Profiler runs by wrapping os.stat and open.
+"""
+from __future__ import print_function
+import os
+import sys
+import time
+import functools
+
+try:
+    import builtins
+except ImportError:  # python2
+    import __builtin__ as builtins
+
+COUNTERS = ['bytes_written', 'files_stated', 'files_changed', 'network_bytes']
+
+# running Profiler, None when profiling is disabled
+_profiler = None
+
+
+class _NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+def phase(name):
+    """
+    :param name: name of the phase, i.e. markdown
+    :return: context manager timing the block as the phase
+    """
+    if _profiler is None:
+        return _NULL_PHASE
+    return _Phase(_profiler, name)
+
+
+def timed(name):
+    """Decorator timing every call of the function as a phase"""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return function(*args, **kwargs)
+            with _Phase(_profiler, name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(counter, amount=1):
+    """
+    Adds to a counter of the current phase
+    :param counter: one of COUNTERS
+    """
+    if _profiler is not None:
+        _profiler.count(counter, amount)
+
+
+class _Phase:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.stack.append(self.name)
+        self.started = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        stats = self.profiler.stats(self.name)
+        stats['calls'] += 1
+        stats['seconds'] += time.time() - self.started
+        self.profiler.stack.pop()
+        return False
+
+
+class _CountingFile(object):
+    """File opened for writing that counts written bytes, characters for text files"""
+
+    def __init__(self, file, profiler):
+        self._file = file
+        self._profiler = profiler
+
+    def write(self, data):
+        self._profiler.count('bytes_written', len(data))
+        return self._file.write(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def __enter__(self):
+        self._file.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._file.__exit__(*exc)
+
+
+class Profiler:
+    """
+    Collects time and io counters of phases while it runs.
+    Phase time includes nested phases, counters go to the innermost phase only.
+    """
+
+    def __init__(self, cprofile=None):
+        """
+        :param cprofile: file to dump cProfile stats to, None to not run cProfile
+        """
+        self.cprofile = cprofile
+        self.phases = {}
+        self.totals = dict((counter, 0) for counter in COUNTERS)
+        self.stack = []
+        self._patched = []
+        self._cprofile = None
+
+    def stats(self, name):
+        if name not in self.phases:
+            self.phases[name] = dict(calls=0, seconds=0.0, **dict((counter, 0) for counter in COUNTERS))
+        return self.phases[name]
+
+    def count(self, counter, amount=1):
+        self.totals[counter] += amount
+        if self.stack:
+            self.stats(self.stack[-1])[counter] += amount
+
+    def _patch(self, owner, name, replacement):
+        self._patched.append((owner, name, getattr(owner, name)))
+        setattr(owner, name, replacement)
+
+    def start(self):
+        """Starts counting, only one profiler runs at a time"""
+        global _profiler
+        _profiler = self
+        self.started = time.time()
+        profiler = self
+
+        def counting_stat(original):
+            def stat(*args, **kwargs):
+                profiler.count('files_stated')
+                return original(*args, **kwargs)
+            return stat
+
+        def counting_open(original):
+            def open(file, mode='r', *args, **kwargs):
+                opened = original(file, mode, *args, **kwargs)
+                if any(flag in mode for flag in 'wax+'):
+                    return _CountingFile(opened, profiler)
+                return opened
+            return open
+
+        self._patch(os, 'stat', counting_stat(os.stat))
+        self._patch(os, 'lstat', counting_stat(os.lstat))
+        self._patch(builtins, 'open', counting_open(builtins.open))
+        if self.cprofile:
+            import cProfile
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def stop(self):
+        """Stops counting and restores the wrapped functions"""
+        global _profiler
+        if self._cprofile:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self.cprofile)
+        for owner, name, original in reversed(self._patched):
+            setattr(owner, name, original)
+        self._patched = []
+        self.seconds = time.time() - self.started
+        _profiler = None
+
+    def report(self):
+        """
+        :return: dict of the collected stats
+        """
+        return {'command': sys.argv[1:], 'seconds': self.seconds, 'totals': self.totals, 'phases': self.phases,
+                'cprofile': self.cprofile}
+
+    def write_report(self, location=None):
+        """
+        Writes JSON report
+        :param location: file to write to, None for stderr
+        """
+        import json
+        report = json.dumps(self.report(), indent=2, sort_keys=True)
+        if location:
+            with open(location, 'w') as report_file:
+                report_file.write(report + '\n')
+        else:
+            print(report, file=sys.stderr)
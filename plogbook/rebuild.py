@@ -0,0 +1,92 @@
+"""
+Rebuilding of the whole Plogbook with the current templates, the work is split across worker processes.
+"""
+from __future__ import print_function
+import sys
+import multiprocessing
+
+from plogbook.book import PlogBook
+from plogbook.archive import get_archive, split_location, rebuild_archived
+
+# PlogBook of the worker process
+_book = None
+
+
+def _init_worker(location):
+    global _book
+    _book = PlogBook(location=location)
+
+
+def _rebuild_plog(location):
+    return _book.rebuild_plog(location)
+
+
+def _rebuild_category(location):
+    """
+    :return: (number of changed pages and themes, number of rebuilt archived plogs)
+    """
+    rebuilt = rebuild_archived(_book, location)  # plogs of a pack are appended to it one after another
+    changed = _book.write_cat_html(location)
+    if _book.legacy_theme:  # templates link theme.css copies in the categories
+        changed += _book.write_theme(location)
+    return changed, rebuilt
+
+
+def _run(pool, func, items, name, jobs):
+    """
+    Runs func over every item printing the progress
+    :return: list of results in no particular order
+    """
+    total = len(items)
+    if pool:
+        results = pool.imap_unordered(func, items, max(1, total // (jobs * 4)))
+    else:
+        results = (func(item) for item in items)
+    step = max(1, total // 100)
+    done = []
+    for result in results:
+        done.append(result)
+        if len(done) % step == 0 or len(done) == total:
+            print('\rrebuilding {}: {}/{}'.format(name, len(done), total), end='')
+            sys.stdout.flush()
+    if total:
+        print()
+    return done
+
+
+def rebuild_all(book, jobs=None):
+    """
+    Re-renders every plog, every category page, the main page, date pages and the feed of the Plogbook.
+    Only plogs that have their source saved next to them can be re-rendered, archived plogs are re-rendered by the
+    worker of their category.
+    :param book: PlogBook to rebuild
+    :param jobs: number of worker processes, defaults to cpu count, 1 rebuilds in the current process
+    :return: number of rebuilt plogs
+    """
+    global _book
+    jobs = jobs or multiprocessing.cpu_count()
+    categories = [cat.location for cat in book.find_categories(silent=True)]
+    plogs = [plog.location for plog in book.find_plogs(silent=True) if split_location(plog.location) is None]
+    archived = sum(len(archive.entries) for archive in filter(None, map(get_archive, categories)))
+    pool = None
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(book.location,))
+    else:
+        _book = book
+    try:
+        rebuilt = _run(pool, _rebuild_plog, plogs, 'plogs', jobs).count(True)
+        if book.index.exists():  # changed plogs have new mtimes
+            book.index.reindex()
+        results = _run(pool, _rebuild_category, categories, 'categories', jobs)
+        changed = sum(result[0] for result in results)
+        rebuilt += sum(result[1] for result in results)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    changed += book.write_theme() + book.write_main_html() + book.write_date_pages() + book.write_feed()
+    print('rebuilt {} plogs, {} categories and main page, {} pages and themes changed'.format(
+        rebuilt, len(categories), changed))
+    if rebuilt < len(plogs) + archived:
+        print('{} plogs have no source to rebuild from'.format(len(plogs) + archived - rebuilt))
+    return rebuilt
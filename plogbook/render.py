@@ -0,0 +1,181 @@
+"""
+Markdown conversion of plog messages with a content addressed cache of the results.
+Converters are looked up by name so a faster markdown package can be used when it's installed, converted html is
+kept in <Plogbook>/.plogbook/render.db keyed by hash of the source and the converter, least recently used entries are
+evicted once the cache grows over its size limit.
+"""
+import os
+import time
+import hashlib
+
+from plogbook import utils
+
+RENDER_FILE = 'render.db'
+MAX_SIZE = 64 * 1024 * 1024  # bytes of cached html
+
+
+class Converter:
+    """
+    Markdown to html converter provided by an optional package, the package is imported on first conversion.
+    """
+
+    def __init__(self, name, module, function):
+        """
+        :param name: name of the converter, i.e. markdown2
+        :param module: name of the module that provides it
+        :param function: function taking the imported module and returning callable converting markdown to html
+        """
+        self.name = name
+        self.module = module
+        self.function = function
+        self._convert = None
+        self._version = None
+
+    def available(self):
+        return utils.has_module(self.module)
+
+    def _load(self):
+        module = __import__(self.module)
+        self._version = str(getattr(module, '__version__', ''))
+        self._convert = self.function(module)
+
+    @property
+    def version(self):
+        if self._convert is None:
+            self._load()
+        return self._version
+
+    def convert(self, text):
+        """
+        :param text: markdown
+        :return: html
+        """
+        if self._convert is None:
+            self._load()
+        return self._convert(text)
+
+
+# known converters by name, in order of preference when none is chosen, markdown2 is the one plogs were always
+# converted with so it goes first
+CONVERTERS = [
+    Converter('markdown2', 'markdown2', lambda module: module.markdown),
+    Converter('cmarkgfm', 'cmarkgfm', lambda module: module.markdown_to_html),
+    Converter('mistune', 'mistune', lambda module: getattr(module, 'html', None) or module.markdown),
+    Converter('markdown', 'markdown', lambda module: module.markdown),
+]
+
+
+def register_converter(name, module, function):
+    """
+    Adds markdown converter that can be chosen with --converter, see Converter for arguments
+    """
+    CONVERTERS[:] = [converter for converter in CONVERTERS if converter.name != name]
+    CONVERTERS.append(Converter(name, module, function))
+
+
+def get_converter(name=None):
+    """
+    :param name: name of the converter, None for the first installed one
+    :return: Converter or None if it's not installed
+    """
+    for converter in CONVERTERS:
+        if (name is None or converter.name == name) and converter.available():
+            return converter
+    return None
+
+
+class RenderCache:
+    """
+    Size bounded LRU cache of converted html stored in sqlite.
+    """
+
+    def __init__(self, path, max_size=MAX_SIZE):
+        """
+        :param path: location of the cache database
+        :param max_size: max bytes of cached html, least recently used entries are evicted over it
+        """
+        self.path = path
+        self.max_size = max_size
+        self._db = None
+        self._size = None
+
+    @property
+    def db(self):
+        if self._db is None:
+            import sqlite3
+            directory = os.path.dirname(self.path)
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            self._db = sqlite3.connect(self.path, timeout=30)
+            self._db.execute('PRAGMA journal_mode = WAL')  # cheap commits, readers don't block writers
+            self._db.execute('PRAGMA synchronous = NORMAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS renders '
+                             '(key TEXT PRIMARY KEY, html TEXT NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS renders_used ON renders (used)')
+        return self._db
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    @staticmethod
+    def key(source, converter):
+        """
+        :return: hash of the source and the converter it's converted with
+        """
+        digest = hashlib.sha1('{}\0{}\0'.format(converter.name, converter.version).encode('utf-8'))
+        digest.update(source.encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        :return: cached html or None
+        """
+        row = self.db.execute('SELECT html FROM renders WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        with self.db:
+            self.db.execute('UPDATE renders SET used = ? WHERE key = ?', (time.time(), key))
+        return row[0]
+
+    def put(self, key, html):
+        size = len(html.encode('utf-8'))
+        with self.db:
+            self.db.execute('INSERT OR REPLACE INTO renders VALUES (?, ?, ?, ?)', (key, html, size, time.time()))
+        self._size = None if self._size is None else self._size + size
+        if self.size() > self.max_size:
+            self.evict(self.max_size * 9 // 10)
+
+    def size(self):
+        """:return: bytes of cached html"""
+        if self._size is None:
+            self._size = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM renders').fetchone()[0]
+        return self._size
+
+    def evict(self, max_size):
+        """
+        Removes least recently used entries until cache is at most max_size bytes
+        """
+        size = self.size()
+        evicted = []
+        for key, entry_size in self.db.execute('SELECT key, size FROM renders ORDER BY used'):
+            if size <= max_size:
+                break
+            evicted.append((key,))
+            size -= entry_size
+        with self.db:
+            self.db.executemany('DELETE FROM renders WHERE key = ?', evicted)
+        self._size = size
+
+    def render(self, source, converter):
+        """
+        Converts source with converter unless the result is already cached
+        :return: html
+        """
+        key = self.key(source, converter)
+        html = self.get(key)
+        if html is None:
+            html = converter.convert(source)
+            self.put(key, html)
+        return html
@@ -0,0 +1,90 @@
+"""
+Full-text search over plogs backed by an inverted index stored in the Plogbook index.
+Documents are ranked with BM25.
+"""
+import re
+import math
+import heapq
+from collections import Counter
+
+from plogbook.plog import read_source, read_html
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+WORD = re.compile(r'\w+', re.UNICODE)
+TAG = re.compile(r'<[^>]*>')
+
+
+def tokenize(text):
+    """
+    :param text: text or html to split
+    :return: list of lowercase terms
+    """
+    return WORD.findall(TAG.sub(' ', text).lower())
+
+
+def document_terms(location, category, title):
+    """
+    Terms of a plog, taken from it's source if it has one otherwise from the html
+    :param location: location of the plog .html file
+    :return: Counter of term frequencies
+    """
+    source = read_source(location)
+    if source is not None:
+        text = source[1]
+    else:
+        text = read_html(location)
+    return Counter(tokenize(' '.join((category, title.replace('.html', ''), text))))
+
+
+def search(db, query, categories=None, since=None, until=None, limit=20):
+    """
+    Finds plogs matching the query ranked by relevance
+    :param db: connection to the Plogbook index
+    :param query: search terms
+    :param categories: list of category names to search in, None for all
+    :param since: timestamp, only plogs created since then
+    :param until: timestamp, only plogs created until then
+    :param limit: max number of results
+    :return: list of (score, location, category, title, created) tuples, best match first
+    """
+    terms = set(tokenize(query))
+    if not terms:
+        return []
+    total, average = db.execute('SELECT COUNT(*), AVG(length) FROM documents').fetchone()
+    if not total:
+        return []
+
+    conditions = ['p.term = ?']
+    params = []
+    if categories:
+        conditions.append('l.category IN ({})'.format(', '.join('?' * len(categories))))
+        params.extend(categories)
+    if since is not None:
+        conditions.append('l.created >= ?')
+        params.append(since)
+    if until is not None:
+        conditions.append('l.created <= ?')
+        params.append(until)
+    query = ('SELECT d.location, p.frequency, d.length FROM postings p JOIN documents d ON d.id = p.document '
+             'JOIN plogs l ON l.location = d.location WHERE ' + ' AND '.join(conditions))
+
+    scores = Counter()
+    for term in terms:
+        frequency = db.execute('SELECT COUNT(*) FROM postings WHERE term = ?', (term,)).fetchone()[0]
+        if not frequency:
+            continue
+        idf = math.log(1 + (total - frequency + 0.5) / (frequency + 0.5))
+        for location, term_frequency, length in db.execute(query, [term] + params):
+            norm = term_frequency + K1 * (1 - B + B * length / average)
+            scores[location] += idf * term_frequency * (K1 + 1) / norm
+
+    best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+    results = []
+    for location, score in best:
+        row = db.execute('SELECT location, category, title, created FROM plogs WHERE location = ?',
+                         (location,)).fetchone()
+        results.append((score,) + tuple(row))
+    return results
@@ -0,0 +1,246 @@
+"""
+Local preview server of the Plogbook.
+Main, category and plog pages are rendered on demand from the index, plog sources and templates instead of being read
+from the generated files, so pages are never stale. Rendered pages are kept in a LRU cache that is checked against
+mtimes of the files a page is rendered from, responses have ETags and are gzipped for browsers that accept it.
+"""
+from __future__ import print_function
+import os
+import re
+import hashlib
+import mimetypes
+from collections import OrderedDict
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from urllib.parse import urlparse, unquote
+except ImportError:  # python2
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from urlparse import urlparse
+    from urllib import unquote
+
+from plogbook import utils, archive
+from plogbook.book import ASSETS_DIR
+from plogbook.index import INDEX_DIR, is_category, is_page
+from plogbook.plog import open_source, source_location
+
+MAX_PAGES = 256  # rendered pages kept in memory
+MIN_GZIP_SIZE = 1024  # smaller responses aren't worth compressing
+PAGE_FILE = re.compile(r'^(?:main|page-(\d+))\.html$')
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+class Page(object):
+    """Rendered page with it's ETag, compressed only when a client asks for it"""
+    __slots__ = ('signature', 'body', 'etag', '_gzipped')
+
+    def __init__(self, signature, body):
+        self.signature = signature
+        self.body = body
+        self.etag = '"{}"'.format(hashlib.sha1(body).hexdigest()[:20])
+        self._gzipped = None
+
+    @property
+    def gzipped(self):
+        if self._gzipped is None:
+            self._gzipped = utils.gzip_bytes(self.body)
+        return self._gzipped
+
+
+class PageCache:
+    """
+    LRU cache of rendered pages, a page is valid while signature of the files it was rendered from is the same.
+    """
+
+    def __init__(self, max_pages=MAX_PAGES):
+        self.max_pages = max_pages
+        self.pages = OrderedDict()
+
+    def get(self, key, signature):
+        """
+        :return: Page or None if it's not cached or it's files changed since
+        """
+        page = self.pages.pop(key, None)
+        if page is None or page.signature != signature:
+            return None
+        self.pages[key] = page  # most recently used go last
+        return page
+
+    def put(self, key, page):
+        self.pages.pop(key, None)
+        self.pages[key] = page
+        while len(self.pages) > self.max_pages:
+            self.pages.popitem(last=False)
+
+
+class Renderer:
+    """
+    Renders pages of a Plogbook by their url path.
+    """
+
+    def __init__(self, book, max_pages=MAX_PAGES):
+        self.book = book
+        self.root = os.path.abspath(book.location)
+        self.cache = PageCache(max_pages)
+
+    def _templates(self):
+        return tuple(_mtime(os.path.join(self.root, 'templates', name)) for name in self.book.templates)
+
+    def page(self, path):
+        """
+        :param path: url path, i.e. /category/main.html
+        :return: Page or None if path isn't a rendered page
+        """
+        parts = [part for part in path.split('/') if part] or ['main.html']
+        if len(parts) == 1 and PAGE_FILE.match(parts[0]):
+            number = int(PAGE_FILE.match(parts[0]).group(1) or 1)
+            categories = [name for name, _, _, _ in self.book.index.categories()]
+            signature = (self._templates(), self.book.page_size, _mtime(self.root),
+                         tuple(_mtime(os.path.join(self.root, name)) for name in categories))
+            return self._cached(path, signature, lambda: self.book.make_main_html(page=number))
+        if len(parts) != 2 or not is_category(self.root, parts[0]):
+            return None
+        directory = os.path.join(self.root, parts[0])
+        match = PAGE_FILE.match(parts[1])
+        if match:
+            number = int(match.group(1)) if match.group(1) else None
+            signature = (self._templates(), self.book.page_size, _mtime(directory))
+            return self._cached(path, signature, lambda: self.book.make_cat_html(directory, page=number))
+        location = os.path.join(directory, parts[1])
+        if not parts[1].endswith('.html') or is_page(parts[1]):
+            return None
+        if not os.path.exists(location):  # archived plogs are served from the pack of the category
+            archived = archive.get_archive(directory)
+            if archived is None or parts[1] not in archived.entries:
+                return None
+            signature = (self._templates(), _mtime(archived.index_location))
+            return self._cached(path, signature, lambda: self._plog(archived.location(parts[1])))
+        if not os.path.exists(source_location(location)):
+            return None  # plogs without source are served as they are
+        signature = (self._templates(), _mtime(location), _mtime(source_location(location)))
+        return self._cached(path, signature, lambda: self._plog(location))
+
+    def _plog(self, location):
+        source = open_source(location)
+        if source is None:  # archived plogs without source are served as they were archived
+            return archive.read(location)
+        parts = []
+        self.book.write_plog_html(parts.append, location, source)
+        return ''.join(parts)
+
+    def _cached(self, key, signature, render):
+        page = self.cache.get(key, signature)
+        if page is not None:
+            return page
+        self.book.reload_templates()
+        self.book.ensure_theme()  # a changed theme gets a new asset
+        self.book.index.reindex()  # pages are rendered from the index, catch up with changed categories
+        html = render()
+        if html is None:
+            return None
+        page = Page(signature, html.encode('utf-8'))
+        self.cache.put(key, page)
+        return page
+
+    def static(self, path):
+        """
+        :param path: url path
+        :return: location of the file under the Plogbook or None if it's not served
+        """
+        location = os.path.abspath(os.path.join(self.root, *[part for part in path.split('/') if part]))
+        relative = os.path.relpath(location, self.root)
+        if relative.startswith(os.pardir) or relative.split(os.sep)[0] == INDEX_DIR or not os.path.isfile(location):
+            return None
+        return location
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    renderer = None  # Renderer of the served Plogbook
+
+    def do_GET(self):
+        path = unquote(urlparse(self.path).path)
+        page = self.renderer.page(path)
+        if page is not None:
+            self.respond(page.body, 'text/html; charset=utf-8', page.etag,
+                         (lambda: page.gzipped) if len(page.body) >= MIN_GZIP_SIZE else None)
+            return
+        location = self.renderer.static(path)
+        if location is None:
+            self.send_error(404)
+            return
+        stat = os.stat(location)
+        etag = '"{:x}-{:x}"'.format(int(stat.st_mtime * 1000000), stat.st_size)
+        content_type = mimetypes.guess_type(location)[0] or 'application/octet-stream'
+        gzipped = None
+        if os.path.exists(location + '.gz'):  # precompressed assets
+
+            def gzipped():
+                with open(location + '.gz', 'rb') as gz_file:
+                    return gz_file.read()
+
+        with open(location, 'rb') as static_file:
+            body = static_file.read()
+        immutable = os.path.relpath(location, self.renderer.root).split(os.sep)[0] == ASSETS_DIR
+        self.respond(body, content_type, etag, gzipped, immutable)
+
+    def respond(self, body, content_type, etag, gzipped=None, immutable=False):
+        """
+        Sends body unless client has it already, compressed if the client accepts gzip
+        :param gzipped: function returning compressed body, None to compress text bodies here
+        :param immutable: whether content at the url never changes, i.e. assets named by their hash
+        """
+        if etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        encoding = None
+        if 'gzip' in self.headers.get('Accept-Encoding', '') and \
+                (gzipped is not None or len(body) >= MIN_GZIP_SIZE and content_type.startswith('text/')):
+            body = gzipped() if gzipped else utils.gzip_bytes(body)
+            encoding = 'gzip'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Cache-Control', 'public, max-age=31536000, immutable' if immutable else 'no-cache')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class PreviewServer(HTTPServer):
+    """Serves requests one at a time, the index and the caches are used from a single thread"""
+    request_queue_size = 64  # browsers open several connections at once
+
+
+def make_server(book, port=8000, host='127.0.0.1', max_pages=MAX_PAGES):
+    """
+    :param book: PlogBook to serve
+    :return: PreviewServer, call serve_forever() to serve
+    """
+    handler = type('PlogbookRequestHandler', (RequestHandler, object), {'renderer': Renderer(book, max_pages)})
+    return PreviewServer((host, port), handler)
+
+
+def serve(book, port=8000, host='127.0.0.1'):
+    """
+    Serves the Plogbook until interrupted
+    """
+    book.ensure_theme()
+    server = make_server(book, port, host)
+    print('Serving Plogbook on http://{}:{}/ (ctrl+c to stop)'.format(host, server.server_port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print()
+    finally:
+        server.server_close()
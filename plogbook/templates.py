@@ -0,0 +1,83 @@
+"""
+Loading and rendering of Plogbook templates.
+Templates are only read when they are first used and are parsed once into Template objects.
+"""
+import os
+from string import Formatter
+
+from plogbook import utils
+
+DEFAULT_DIRECTORY = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'default_styles')
+
+# Parsed templates of this process by path: (mtime, Template)
+_cache = {}
+
+
+class Template:
+    """
+    Parsed template.
+    Templates are python format strings, fields of the template are found once when it's parsed so rendering is a
+    single call of the bound str.format.
+    """
+
+    def __init__(self, name, source, formatted=True):
+        """
+        :param name: template file name, i.e. plog.html
+        :param source: template content
+        :param formatted: whether template has fields, theme.css for example is used as is
+        """
+        self.name = name
+        self.source = source
+        self.fingerprint = utils.fingerprint(source)
+        self.fields = set()
+        if formatted:
+            self.fields = set(field for _, field, _, _ in Formatter().parse(source) if field)
+        self._format = source.format
+
+    def render(self, **fields):
+        """
+        :param fields: values of the template fields
+        :return: rendered template
+        """
+        return self._format(template=self.source, **fields)
+
+    def render_many(self, items):
+        """
+        Renders template for every dict of fields in items
+        :return: list of rendered templates
+        """
+        format = self._format
+        source = self.source
+        return [format(template=source, **fields) for fields in items]
+
+    def split(self, field, **fields):
+        """
+        Renders template around a field so the field content can be streamed between the two parts.
+        :param field: name of the field to split on, i.e. items
+        :param fields: values of the rest of the fields
+        :return: (head, tail) strings, tail is empty if the template has no such field
+        """
+        marker = '\x00{}\x00'.format(field)
+        fields[field] = marker
+        head, _, tail = self.render(**fields).partition(marker)
+        return head, tail
+
+
+def load_template(path, name, formatted=True):
+    """
+    Reads and parses template, templates are parsed again only when their file changes
+    :param path: location of the template file
+    :param name: template name
+    :return: Template or None if the file doesn't exist
+    """
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+    cached = _cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, 'r') as template_file:
+        template = Template(name, template_file.read(), formatted=formatted)
+    _cache[path] = (mtime, template)
+    return template
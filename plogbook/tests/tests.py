@@ -1,6 +1,29 @@
 from plogbook import utils
+from plogbook.book import PlogBook
+from plogbook.plog import write_source, read_header, make_header, open_source, HEADER_PREFIX
+from plogbook.rebuild import rebuild_all
+from plogbook import watch, editor, render, profiling, serve, archive
 
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
+from datetime import datetime
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from urllib.parse import unquote
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from urllib import unquote
+
+# checkout the command line tests run plogbook from
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Here's our "unit tests".
 class UtilsTests(unittest.TestCase):
@@ -16,6 +39,722 @@ class UtilsTests(unittest.TestCase):
         for test in tests:
             self.failUnlessEqual(utils.truncate(*test[0]), test[1])
 
+    def test_atomic_file(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        location = os.path.join(directory, 'plog.html')
+        with utils.atomic_file(location) as f:
+            f.write('old')
+        try:
+            with utils.atomic_file(location) as f:
+                f.write('half')
+                raise ValueError
+        except ValueError:
+            pass
+        with open(location) as f:
+            self.assertEqual(f.read(), 'old')
+        self.assertEqual(os.listdir(directory), ['plog.html'])
+
+
+class BookTestCase(unittest.TestCase):
+    """Creates temporary Plogbook with categories and plogs"""
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+
+    def make_plog(self, category, title, msg='test'):
+        directory = os.path.join(self.location, category)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+            with open(os.path.join(directory, '.category'), 'w') as f:
+                f.write('')
+        location = os.path.join(directory, title + '.html')
+        with open(location, 'w') as f:
+            f.write(msg)
+        return location
+
+
+class DiscoveryTests(BookTestCase):
+
+    def test_scan(self):
+        first = self.make_plog('cat1', 'first')
+        self.make_plog('cat1', 'second')
+        self.make_plog(os.path.join('cat1', 'nested'), 'third')
+        os.makedirs(os.path.join(self.location, 'not a category'))
+        with open(os.path.join(self.location, 'not a category', 'page.html'), 'w') as f:
+            f.write('')
+        os.utime(first, (0, 0))
+        book = PlogBook(self.location)
+        plogs = book.find_plogs(silent=True)
+        self.assertEqual(sorted(plog.title for plog in plogs), ['first.html', 'second.html', 'third.html'])
+        self.assertFalse(hasattr(plogs[0], '__dict__'))
+        self.assertEqual(len(book.find_plogs(os.path.join(self.location, 'cat1'), recursive=False, silent=True)), 2)
+        categories = book.find_categories(silent=True)
+        self.assertEqual([(cat.name, cat.plog_count) for cat in categories], [('cat1', 2)])
+
+    def test_parallel_categories(self):
+        for number in range(10):
+            self.make_plog('cat{}'.format(number), 'plog')
+        book = PlogBook(self.location)
+        names = ['cat{}'.format(number) for number in range(10)]
+        self.assertEqual([cat.name for cat in book.find_categories(silent=True, jobs=4)], names)
+        self.assertEqual(sorted(cat.name for cat in book.iter_categories(jobs=4, ordered=False)), names)
+        self.assertEqual([cat.name for cat in book.find_categories(silent=True, jobs=1)], names)
+
+    def test_metadata_header(self):
+        book = PlogBook(self.location)
+        directory = os.path.join(self.location, 'cat1')
+        os.makedirs(directory)
+        book.mark_category(directory, created=5)
+        location = os.path.join(directory, 'first.html')
+        with open(location, 'w') as f:
+            f.write(book.make_log_html('hi', 'cat1', 'first --> title', 'date', created=100, source='digest'))
+        self.assertEqual(read_header(location), {'category': 'cat1', 'title': 'first --> title', 'created': 100,
+                                                 'source': 'digest'})
+        self.assertEqual([plog.created for plog in book.find_plogs(silent=True)], [100])  # not the file ctime
+        self.assertEqual([cat.created for cat in book.find_categories(silent=True)], [5])
+        book.index.reindex()
+        self.assertEqual([plog.created for plog in book.find_plogs(silent=True)], [100])
+        self.assertEqual([created for _, _, created, _ in book.index.categories()], [5])
+
+
+class ListingTests(BookTestCase):
+
+    def test_find_plogs_output(self):
+        import json
+        from io import StringIO
+        from plogbook import output
+        for number, category in enumerate(['cat1', 'cat1', 'cat2', 'cat1']):
+            location = self.make_plog(category, 'plog{}'.format(number))
+            os.utime(location, (number * 100, number * 100))
+        book = PlogBook(self.location)
+        book.index.reindex()
+        plogs = book.find_plogs(silent=True, categories=['cat1'], sort='-title', limit=2)
+        self.assertEqual([plog.title for plog in plogs], ['plog3.html', 'plog1.html'])
+        self.assertEqual(len(book.find_plogs(silent=True, limit=3)), 3)
+        self.assertRaises(ValueError, book.find_plogs, silent=True, sort='size')
+        self.assertRaises(ValueError, book.find_plogs, silent=True, sort='date:up')
+
+        out = StringIO()
+        self.assertEqual(output.write_rows(plogs, output.PLOG_FIELDS, 'jsonl', out), 2)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([(row['title'], row['category']) for row in rows], [('plog3.html', 'cat1'), ('plog1.html', 'cat1')])
+        out = StringIO()
+        output.write_rows(book.find_categories(silent=True, sort='-count'), output.CATEGORY_FIELDS, 'tsv', out)
+        self.assertEqual([line.split('\t')[:2] for line in out.getvalue().splitlines()],
+                         [['name', 'plog_count'], ['cat1', '3'], ['cat2', '1']])
+
+
+    def test_find_command(self):
+        for number in range(3):
+            location = self.make_plog('cat1', 'plog{}'.format(number))
+            os.utime(location, (number * 100, number * 100))
+        found = subprocess.check_output([sys.executable, '-m', 'plogbook', '--location', self.location, '--findr',
+                                         '--sort', 'title:desc', '--limit', '2', '--format', 'tsv'],
+                                        universal_newlines=True, cwd=ROOT)
+        self.assertEqual([line.split('\t')[2] for line in found.splitlines()[1:]], ['plog2.html', 'plog1.html'])
+
+
+class IndexTests(BookTestCase):
+
+    def test_index(self):
+        self.make_plog('cat1', 'first')
+        self.make_plog('cat1', 'second')
+        self.make_plog('cat2', 'third')
+        book = PlogBook(self.location)
+        self.assertFalse(book.index.exists())
+        self.assertEqual(sorted(book.index.reindex(full=True)), ['cat1', 'cat2'])
+        self.assertEqual(sorted((c.name, c.plog_count) for c in book.find_categories(silent=True)),
+                         [('cat1', 2), ('cat2', 1)])
+        self.assertEqual(len(book.find_plogs(silent=True)), 3)
+        self.assertEqual(book.index.reindex(), [])
+
+    def test_reindex_changed(self):
+        self.make_plog('cat1', 'first')
+        book = PlogBook(self.location)
+        book.index.reindex(full=True)
+        self.make_plog('cat1', 'second')
+        os.utime(os.path.join(self.location, 'cat1'), (0, 0))
+        self.assertEqual(book.index.reindex(), ['cat1'])
+        self.assertEqual(len(book.find_plogs(os.path.join(self.location, 'cat1'), silent=True)), 2)
+
+
+class SearchTests(BookTestCase):
+
+    def test_search(self):
+        self.make_plog('cat1', 'first', msg='<p>banana apple</p>')
+        self.make_plog('cat1', 'second', msg='<p>banana banana banana</p>')
+        self.make_plog('cat2', 'third', msg='<p>cherry</p>')
+        book = PlogBook(self.location)
+        book.index.reindex(full=True)
+        found = book.search('banana', silent=True)
+        self.assertEqual([plog.title for score, plog in found], ['second.html', 'first.html'])
+        self.assertEqual(book.search('banana', categories=['cat2'], silent=True), [])
+        self.assertEqual(book.search('banana', since=utils.parse_date('2100-01-01'), silent=True), [])
+        self.make_plog('cat2', 'fourth', msg='banana')
+        os.utime(os.path.join(self.location, 'cat2'), (0, 0))
+        book.index.reindex()
+        self.assertEqual(len(book.search('banana', silent=True)), 3)
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    """Stand-in image server, /a.png and /b.png have the same content"""
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        if self.path not in ('/a.png', '/b.png'):
+            self.send_error(404)
+            return
+        body = b'\x89PNG' * 50000
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ImagesTests(BookTestCase):
+
+    def setUp(self):
+        super(ImagesTests, self).setUp()
+        ImageHandler.requests = []
+        self.server = HTTPServer(('127.0.0.1', 0), ImageHandler)
+        threading.Thread(target=self.server.serve_forever).start()
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        super(ImagesTests, self).tearDown()
+
+    def test_localize_images(self):
+        html = '<img src="{0}/a.png"><img src="{0}/a.png"><img src="{0}/b.png"><img src="{0}/missing.png">'
+        html = html.format(self.url)
+        cache = os.path.join(self.location, 'cache')
+        cat1 = os.path.join(self.location, 'cat1')
+        converted = PlogBook.convert_html(html, cat1, localize_img=True, cache_directory=cache)
+        self.assertEqual(sorted(set(ImageHandler.requests)), ['/a.png', '/b.png', '/missing.png'])
+        self.assertEqual(ImageHandler.requests.count('/a.png'), 1)
+        self.assertEqual(len(os.listdir(os.path.join(cat1, 'images'))), 1)
+        self.assertIn('{}/missing.png'.format(self.url), converted)
+        self.assertEqual(converted.count('src="images/'), 3)
+
+        ImageHandler.requests = []
+        cat2 = os.path.join(self.location, 'cat2')
+        PlogBook.convert_html(html.replace('/missing.png', '/a.png'), cat2, localize_img=True, cache_directory=cache)
+        self.assertEqual(ImageHandler.requests, [])
+        self.assertEqual(len(os.listdir(os.path.join(cat2, 'images'))), 1)
+
+    def test_rebuild_keeps_remote_images(self):
+        from plogbook.images import legacy_name
+        cat1 = os.path.join(self.location, 'cat1', 'images')
+        os.makedirs(cat1)
+        local, remote = '{}/local.png'.format(self.url), '{}/remote.png'.format(self.url)
+        open(os.path.join(cat1, legacy_name(local)), 'w').close()
+        html = '<img src="{}"><img src="{}">'.format(local, remote)
+        converted = PlogBook.convert_html(html, os.path.dirname(cat1), localize_img=True, download=False,
+                                          cache_directory=os.path.join(self.location, 'cache'))
+        self.assertIn('src="images/{}"'.format(legacy_name(local)), converted)
+        self.assertIn('src="{}"'.format(remote), converted)
+        self.assertEqual(ImageHandler.requests, [])
+
+    @unittest.skipUnless(os.path.isdir('/proc/self/fd'), 'needs /proc to count open files')
+    def test_failed_download_closes_file(self):
+        from plogbook.images import ImageCache
+        cache = ImageCache(os.path.join(self.location, 'cache'), retries=0)
+        opened = len(os.listdir('/proc/self/fd'))
+        for _ in range(3):
+            self.assertRaises(Exception, cache._download, '{}/missing.png'.format(self.url))
+        self.assertEqual(len(os.listdir('/proc/self/fd')), opened)
+        self.assertEqual(os.listdir(cache.location), [])
+
+
+class UpdateHtmlTests(BookTestCase):
+
+    def test_update_html(self):
+        self.make_plog('cat1', 'first')
+        book = PlogBook(self.location)
+        book.index.reindex(full=True)
+        book.write_cat_html(os.path.join(self.location, 'cat1'))
+        location = self.make_plog('cat1', 'second')
+        book.index.add_plog(location)
+        book.update_html(location)
+        items = book.index.page_items('cat1', book.get_template('category_item.html').fingerprint)
+        self.assertEqual(len(items), 2)
+        self.assertIn('second.html', items[1])
+        with open(os.path.join(self.location, 'cat1', 'main.html')) as f:
+            page = f.read()
+        self.assertEqual(page.count('cat_entry_title'), 2)
+        with open(os.path.join(self.location, 'main.html')) as f:
+            self.assertIn('cat1/main.html', f.read())
+
+    def test_unchanged_files(self):
+        self.make_plog('cat1', 'first')
+        book = PlogBook(self.location)
+        book.index.reindex(full=True)
+        category = os.path.join(self.location, 'cat1')
+        self.assertEqual(book.write_cat_html(category), 1)
+        self.assertEqual(book.write_theme(category), 2)
+        main = os.path.join(category, 'main.html')
+        self.assertEqual(os.stat(main).st_mode & 0o044, 0o044)  # temporary files are private, pages mustn't be
+        mtime = os.stat(main).st_mtime
+        self.assertEqual(book.write_cat_html(category) + book.write_theme(category), 0)
+        self.assertEqual(os.stat(main).st_mtime, mtime)
+        self.assertEqual(book.index.reindex(), [])  # own writes don't make category rescanned
+        self.assertEqual([name for name in os.listdir(category) if name.endswith('.tmp')], [])
+
+
+class PaginationTests(BookTestCase):
+
+    def test_pages(self):
+        for index in range(5):
+            self.make_plog('cat1', 'plog {}'.format(index))
+        book = PlogBook(self.location, page_size=2)
+        book.index.reindex(full=True)
+        category = os.path.join(self.location, 'cat1')
+        book.write_cat_html(category)
+        self.assertTrue(set(['main.html', 'page-1.html', 'page-2.html']) <= set(os.listdir(category)))
+        self.assertFalse(os.path.exists(os.path.join(category, 'page-3.html')))
+        self.assertEqual(len(book.find_plogs(category, silent=True)), 5)
+        with open(os.path.join(category, 'main.html')) as f:
+            page = f.read()
+        self.assertEqual(page.count('cat_entry_title'), 2)
+        self.assertIn("href='page-2.html'", page)
+
+        page_location = os.path.join(category, 'page-1.html')
+        os.utime(page_location, (0, 0))
+        book.write_cat_html(category)
+        self.assertEqual(os.path.getmtime(page_location), 0)  # full pages don't change
+
+        rewritten = self.make_plog('cat1', 'plog 0', msg=make_header('cat1', 'plog 0.html', time.time() + 100, None))
+        book.index.add_plog(rewritten)
+        book.update_html(rewritten)
+        with open(page_location) as f:
+            self.assertNotIn('plog 0.html', f.read())  # items shifted to the older page
+        with open(os.path.join(category, 'main.html')) as f:
+            self.assertIn('plog 0.html', f.read())
+
+    def test_unchanged_pages_not_rendered(self):
+        for index in range(6):
+            self.make_plog('cat1', 'plog {}'.format(index))
+        book = PlogBook(self.location, page_size=2)
+        book.index.reindex(full=True)
+        category = os.path.join(self.location, 'cat1')
+        book.write_cat_html(category)
+        rendered = []
+        write_cat_page = book._write_cat_page
+        book._write_cat_page = lambda write, count, items, number, theme: \
+            rendered.append(number) or write_cat_page(write, count, items, number, theme)
+        newest = self.make_plog('cat1', 'newest', msg=make_header('cat1', 'newest.html', time.time() + 100, None))
+        book.index.add_plog(newest)
+        book.update_html(newest)
+        self.assertEqual(rendered, [])  # newest plog only goes to main.html
+        book.write_cat_html(category, force=True)
+        self.assertEqual(rendered, [1, 2, 3])
+
+
+class StreamingTests(BookTestCase):
+
+    def test_paragraphs(self):
+        from io import StringIO
+        from plogbook.book import paragraphs
+        for msg in (u'', u'line', u'first\nsecond', u'trailing\n', u'\n\nblank\n\n'):
+            expected = [u'<p>{}</p>'.format(line) for line in msg.split(u'\n')]
+            self.assertEqual(list(paragraphs(msg)), expected)
+            self.assertEqual(list(paragraphs(StringIO(msg))), expected)
+
+    def test_write_log_html(self):
+        book = PlogBook(self.location)
+        msg = u'\n'.join(u'line {}'.format(number) for number in range(20000))
+        parts = []
+        book.write_log_html(parts.append, msg, 'cat', 'title', 'date')
+        self.assertGreater(len(parts), 3)  # message is written in chunks
+        self.assertEqual(u''.join(parts), book.get_template('plog.html').render(
+            msg=u''.join(u'<p>{}</p>'.format(line) for line in msg.split(u'\n')), cat='cat', title='title', date='date',
+            theme=book.theme_href(os.path.join(self.location, 'cat'))))
+
+
+class ThemeTests(BookTestCase):
+
+    def test_shared_theme(self):
+        import gzip
+        self.make_plog('cat1', 'first')
+        legacy = os.path.join(self.location, 'legacy')
+        os.makedirs(legacy)
+        with open(os.path.join(legacy, 'theme.css'), 'w') as f:  # categories used to be marked by their theme
+            f.write('')
+        book = PlogBook(self.location)
+        self.assertEqual(sorted(cat.name for cat in book.find_categories(silent=True)), ['cat1', 'legacy'])
+        category = os.path.join(self.location, 'cat1')
+        book.write_theme(category)
+        book.write_cat_html(category)
+        self.assertFalse(os.path.exists(os.path.join(category, 'theme.css')))
+        asset = book.theme_location
+        self.assertEqual(os.path.dirname(asset), os.path.join(self.location, 'assets'))
+        with gzip.open(asset + '.gz') as f:
+            self.assertEqual(f.read().decode('utf-8'), book.template_theme)
+        with open(os.path.join(category, 'main.html')) as f:
+            self.assertIn('href="../assets/{}"'.format(os.path.basename(asset)), f.read())
+        self.assertEqual(book.ensure_theme(category), 0)
+
+        os.makedirs(os.path.join(self.location, 'templates'))
+        with open(os.path.join(self.location, 'templates', 'category.html'), 'w') as f:
+            f.write('<link rel="stylesheet" href="theme.css">{items}')
+        book.reload_templates()
+        self.assertTrue(book.legacy_theme)
+        self.assertEqual(book.ensure_theme(category), 1)  # old templates get a copy next to the page
+        self.assertTrue(os.path.exists(os.path.join(category, 'theme.css')))
+
+
+class ServeTests(BookTestCase):
+
+    def setUp(self):
+        super(ServeTests, self).setUp()
+        self.book = PlogBook(self.location)
+        self.server = serve.make_server(self.book, port=0)
+        threading.Thread(target=self.server.serve_forever).start()
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        super(ServeTests, self).tearDown()
+
+    def get(self, path, **headers):
+        try:
+            from urllib.request import urlopen, Request
+            from urllib.error import HTTPError
+        except ImportError:
+            from urllib2 import urlopen, Request, HTTPError
+        try:
+            response = urlopen(Request(self.url + path, headers=headers))
+        except HTTPError as e:
+            return e.code, e.headers, b''
+        return response.getcode(), response.headers, response.read()
+
+    def test_serve(self):
+        location = self.make_plog('cat1', 'first', msg='old')
+        write_source(location, 'from source', category='cat1', title='first', date='today')
+        status, headers, body = self.get('/')
+        self.assertEqual(status, 200)
+        self.assertIn(b'cat1/main.html', body)
+        self.assertFalse(os.path.exists(os.path.join(self.location, 'main.html')))  # rendered, not written
+        self.assertEqual(self.get('/', **{'If-None-Match': headers['ETag']})[0], 304)
+        self.assertIn(b'<p>from source</p>', self.get('/cat1/first.html')[2])
+        self.assertIn(b'first.html', self.get('/cat1/main.html')[2])
+        self.assertEqual(self.get('/cat1/page-5.html')[0], 404)
+        self.assertEqual(self.get('/.plogbook/index.db')[0], 404)
+
+        self.make_plog('cat1', 'second')
+        os.utime(os.path.join(self.location, 'cat1'), (0, 0))  # mtime has to change even on coarse clocks
+        self.assertIn(b'second.html', self.get('/cat1/main.html')[2])
+        status, headers, body = self.get('/' + os.path.relpath(self.book.theme_location, self.location),
+                                         **{'Accept-Encoding': 'gzip'})
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', headers['Cache-Control'])
+
+
+
+class TemplateTests(BookTestCase):
+
+    def test_custom_template(self):
+        book = PlogBook(self.location)
+        self.assertEqual(book._templates, {})
+        self.assertIn('{msg}', book.template_plog)
+        template_dir = os.path.join(self.location, 'templates')
+        os.makedirs(template_dir)
+        with open(os.path.join(template_dir, 'plog.html'), 'w') as f:
+            f.write('<p>{title}</p>{msg}')
+        book.reload_templates()
+        self.assertEqual(book.make_log_html('hi', 'cat', 'title', 'date'), '<p>title</p><p>hi</p>')
+        self.assertEqual(book.get_template('plog.html').fields, {'title', 'msg'})
+
+
+class StartupTests(unittest.TestCase):
+
+    def test_deferred_imports(self):
+        deferred = ['markdown2', 'subprocess', 'tempfile', 'webbrowser', 'sqlite3', 'plogbook.search']
+        code = 'import sys, plogbook.argparser; print(" ".join(sys.modules))'
+        modules = subprocess.check_output([sys.executable, '-c', code], universal_newlines=True).split()
+        self.assertEqual([name for name in deferred if name in modules], [])
+
+
+class WatchTests(BookTestCase):
+
+    def check_watcher(self, polling):
+        self.make_plog('cat1', 'first')
+        book = PlogBook(self.location)
+        book.index.reindex()
+        book.write_cat_html(os.path.join(self.location, 'cat1'))
+        watcher = watch.make_watcher(self.location, polling=polling)
+        try:
+            self.make_plog('cat1', 'second')
+            changes = watcher.changes(1)
+            self.assertIn((os.path.join(self.location, 'cat1', 'second.html'), False), changes)
+            self.assertEqual(watch.update(book, changes), ['cat1'])
+            with open(os.path.join(self.location, 'cat1', 'main.html')) as f:
+                self.assertIn('second', f.read())
+            self.assertEqual(watch.update(book, watcher.changes(0.1)), [])  # own writes are not changes
+        finally:
+            watcher.close()
+
+    def test_polling(self):
+        self.check_watcher(polling=True)
+
+    def test_inotify(self):
+        watcher = watch.make_watcher(self.location)
+        watcher.close()
+        if not isinstance(watcher, watch.InotifyWatcher):
+            self.skipTest('inotify is not available')
+        self.check_watcher(polling=False)
+
+
+class EditorTests(BookTestCase):
+
+    def editor(self, content=None):
+        """Command of an editor that writes content to the draft or exits right away without touching it"""
+        if content is None:
+            return '"{}" -c pass'.format(sys.executable)
+        return '"{}" -c "import sys; open(sys.argv[-1], \'w\').write(sys.argv[1])" \'{}\''.format(sys.executable, content)
+
+    def test_edit(self):
+        drafts = os.path.join(self.location, 'drafts')
+        session = editor.EditorSession(self.editor('hello'), drafts)
+        self.assertEqual(session.edit(), 'hello')
+        session.close()
+        self.assertEqual(os.listdir(drafts), [])
+        session = editor.EditorSession(self.editor(' \n'), drafts)
+        self.assertIsNone(session.edit())
+        session.close()
+        session = editor.EditorSession(self.editor(), drafts)  # terminal editor quit without saving
+        self.assertIsNone(session.edit())
+        session.close()
+        self.assertTrue(editor.is_detaching(['/usr/bin/code', '-n']))
+        self.assertFalse(editor.is_detaching(['code', '--wait']))
+        self.assertFalse(editor.is_detaching(['nano']))
+
+    def test_detached(self):
+        settle, editor.SETTLE_TIME = editor.SETTLE_TIME, 0.1
+        try:
+            session = editor.EditorSession(self.editor(), os.path.join(self.location, 'drafts'), detached=True)
+            self.assertIsNone(session.edit(timeout=0.3))
+            other = editor.EditorSession(self.editor(), os.path.join(self.location, 'drafts'), detached=True)
+
+            def save():
+                with open(other.location, 'w') as f:
+                    f.write('saved later')
+            threading.Timer(0.3, save).start()
+            self.assertEqual(other.edit(timeout=5), 'saved later')
+        finally:
+            editor.SETTLE_TIME = settle
+
+
+class ImportTests(BookTestCase):
+
+    def test_import(self):
+        notes = tempfile.mkdtemp()
+        try:
+            os.makedirs(os.path.join(notes, 'ideas'))
+            with open(os.path.join(notes, 'ideas', 'first.txt'), 'w') as f:
+                f.write('first idea')
+            with open(os.path.join(notes, 'loose.md'), 'w') as f:
+                f.write('loose note')
+            jsonl = os.path.join(notes, 'export.jsonl')
+            with open(jsonl, 'w') as f:
+                f.write('{"category": "ideas", "title": "second", "msg": "second idea", "created": "2015-01-02"}\n')
+                f.write('{"title": "no category"}\n')
+            from plogbook.importer import read_records
+            book = PlogBook(self.location)
+            written = book.add_plogs(read_records(notes), jobs=1)
+            written += book.add_plogs(read_records(jsonl), jobs=2)
+            self.assertEqual(len(written), 3)
+            self.assertEqual(book.add_plogs(read_records(jsonl), jobs=1), [])  # existing plogs are skipped
+            self.assertEqual(set((name, count) for name, _, _, count in book.index.categories()),
+                             set([(os.path.basename(notes), 1), ('ideas', 2)]))
+            with open(os.path.join(self.location, 'ideas', 'main.html')) as f:
+                self.assertIn('second', f.read())
+            self.assertTrue(os.path.exists(os.path.join(self.location, 'main.html')))
+        finally:
+            shutil.rmtree(notes)
+
+
+class RenderTests(BookTestCase):
+
+    def setUp(self):
+        BookTestCase.setUp(self)
+        self.converted = []
+
+        def convert(text):
+            self.converted.append(text)
+            return '<p>{}</p>'.format(text)
+        render.register_converter('test', 'json', lambda module: convert)
+
+    def tearDown(self):
+        render.CONVERTERS[:] = [converter for converter in render.CONVERTERS if converter.name != 'test']
+        BookTestCase.tearDown(self)
+
+    def test_render_cache(self):
+        book = PlogBook(self.location)
+        self.assertTrue(book.set_converter('test'))
+        self.assertFalse(book.set_converter('not installed'))
+        self.assertEqual(PlogBook(self.location).converter.name, 'test')
+        self.assertEqual(book.markdown('hello'), '<p>hello</p>')
+        self.assertEqual(book.markdown('hello'), '<p>hello</p>')
+        self.assertEqual(self.converted, ['hello'])
+
+        cache = render.RenderCache(os.path.join(self.location, 'render.db'), max_size=120)
+        converter = render.get_converter('test')
+        for text in ('a' * 40, 'b' * 40, 'a' * 40, 'c' * 40):
+            cache.render(text, converter)
+        self.assertIsNone(cache.get(cache.key('b' * 40, converter)))  # least recently used
+        self.assertIsNotNone(cache.get(cache.key('a' * 40, converter)))
+        self.assertLessEqual(cache.size(), 120)
+        cache.close()
+        book.render_cache.close()
+
+
+class RebuildTests(BookTestCase):
+
+    def test_rebuild_all(self):
+        location = self.make_plog('cat1', 'first', msg='old')
+        write_source(location, 'new {message}', category='cat1', title='first', date='today')
+        self.make_plog('cat1', 'without source')
+        os.utime(location, (0, 0))
+        book = PlogBook(self.location)
+        created = book.find_plogs(silent=True)[0].created
+        self.assertEqual(rebuild_all(book, jobs=1), 1)
+        with open(location) as f:
+            self.assertIn('<p>new {message}</p>', f.read())
+        self.assertNotEqual(os.stat(location).st_mtime, 0)  # changed plogs get a new mtime for backups
+        self.assertEqual(read_header(location)['created'], created)  # source without date keeps the listed one
+        self.assertTrue(os.path.exists(os.path.join(self.location, 'cat1', 'main.html')))
+
+
+class DatesTests(BookTestCase):
+
+    def make_dated_plog(self, category, title, date):
+        created = time.mktime(date.timetuple())
+        return self.make_plog(category, title, msg=make_header(category, title + '.html', created, None) + title)
+
+    def test_date_pages(self):
+        self.make_dated_plog('cat1', 'first', datetime(2020, 1, 5))
+        self.make_dated_plog('cat2', 'second', datetime(2020, 3, 5))
+        self.make_dated_plog('cat1', 'third', datetime(2021, 7, 5))
+        book = PlogBook(self.location)
+        book.reindex()
+        self.assertEqual(book.write_date_pages(), 6)
+        dates = os.path.join(self.location, 'dates')
+        self.assertEqual(sorted(os.listdir(dates)),
+                         ['2020-01.html', '2020-03.html', '2020.html', '2021-07.html', '2021.html', 'main.html'])
+        with open(os.path.join(dates, '2020.html')) as f:
+            page = f.read()
+        self.assertLess(page.index('2020-03.html'), page.index('2020-01.html'))  # newest month first
+        location = self.make_dated_plog('cat2', 'fourth', datetime(2020, 1, 20))
+        book.index.add_plog(location)
+        os.utime(os.path.join(dates, '2020.html'), (0, 0))
+        book.update_html(location)
+        with open(os.path.join(dates, '2020-01.html')) as f:
+            self.assertIn("href='../cat2/fourth.html'", f.read())
+        self.assertEqual(os.stat(os.path.join(dates, '2020.html')).st_mtime, 0)  # month isn't new
+        with open(os.path.join(self.location, 'feed.atom')) as f:
+            feed = f.read()
+        self.assertEqual(feed.count('<entry>'), 4)
+        self.assertLess(feed.index('cat1/third.html'), feed.index('cat2/fourth.html'))
+        self.assertEqual(book.make_feed(size=1).count('<entry>'), 1)
+
+
+    def test_dates_category(self):
+        from plogbook.index import is_valid_category
+        self.assertFalse(any(is_valid_category(name) for name in ('dates', 'templates', 'assets', '.hidden', '')))
+        self.assertTrue(is_valid_category('my notes'))
+        self.make_dated_plog('dates', 'old', datetime(2020, 1, 5))  # category made before date pages existed
+        book = PlogBook(self.location)
+        book.reindex()
+        self.assertEqual(book.write_date_pages(), 0)
+        self.assertEqual([plog.title for plog in book.find_plogs(silent=True)], ['old.html'])
+        self.assertFalse(os.path.exists(os.path.join(self.location, 'dates', 'main.html')))
+
+    def test_write_reserved_category(self):
+        code = 'import sys; from plogbook.book import PlogBook; PlogBook(sys.argv[1]).write_plog()'
+        process = subprocess.Popen([sys.executable, '-c', code, self.location], stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE, cwd=ROOT)
+        process.communicate(b'dates\nmy notes\nhi')
+        self.assertEqual(process.returncode, 0)
+        self.assertTrue(os.path.exists(os.path.join(self.location, 'dates_', 'my notes.html')))
+        self.assertFalse(os.path.exists(os.path.join(self.location, 'dates', 'my notes.html')))
+        self.assertTrue(os.path.exists(os.path.join(self.location, 'dates', 'main.html')))
+
+
+class ArchiveTests(BookTestCase):
+
+    def test_archive(self):
+        old = self.make_plog('cat1', 'old', msg=make_header('cat1', 'old.html', 1000.0, None) + 'old')
+        write_source(old, 'old {message}', category='cat1', title='old', date='long ago', created=1000.0)
+        self.make_plog('cat1', 'older', msg=make_header('cat1', 'older.html', 500.0, None) +
+                       "<head><link href='theme.css'></head><table id='plog_table'>older</table>")
+        self.make_plog('cat1', 'new')
+        book = PlogBook(self.location)
+        book.reindex()
+        book.write_theme()
+        self.assertEqual(archive.archive_plogs(book, before=2000.0), 2)
+        directory = os.path.join(self.location, 'cat1')
+        self.assertFalse(os.path.exists(old))
+        self.assertFalse(os.path.exists(old.replace('.html', '.plog')))
+        archived = os.path.join(directory, archive.PACK_FILE, 'old.html')
+        for plogs in (book.find_plogs(silent=True), PlogBook._scan_plogs(self.location, recursive=True)):
+            self.assertEqual(sorted((plog.location, plog.created) for plog in plogs)[0], (archived, 1000.0))
+        self.assertIn("href='archive-1.html#old.html'", book.make_cat_html(directory))
+        pages = [os.path.join(directory, 'main.html'), os.path.join(self.location, 'feed.atom')]
+        pages += [os.path.join(self.location, 'dates', name) for name in os.listdir(os.path.join(self.location, 'dates'))]
+        for page in pages:  # links work without --serve
+            with open(page) as f:
+                for href in re.findall(r'href=[\'"]([^\'"]+)[\'"]', f.read()):
+                    target = os.path.join(os.path.dirname(page), unquote(href.split('#')[0]))
+                    self.assertTrue(os.path.isfile(target), '{} links missing {}'.format(page, href))
+        with open(os.path.join(directory, 'archive-1.html')) as f:
+            page = f.read()
+        self.assertIn('<div id="old.html" class=\'archived_plog\'>', page)
+        self.assertIn('<p>old {message}</p>', page)  # rendered from the source
+        self.assertLess(page.index('older</table>'), page.index('<p>old {message}</p>'))
+        self.assertEqual(page.count('<head>'), 1)
+        self.assertNotIn(HEADER_PREFIX, page)
+        ids = re.findall(r'\sid=[\'"]([^\'"]+)', page)
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(open_source(archived)[0]['date'], 'long ago')
+        self.assertEqual(rebuild_all(book, jobs=1), 1)
+        self.assertIn('<p>old {message}</p>', archive.read(archived))
+        size = os.path.getsize(os.path.join(directory, archive.PACK_FILE))
+        self.assertEqual(rebuild_all(book, jobs=1), 1)
+        self.assertEqual(os.path.getsize(os.path.join(directory, archive.PACK_FILE)), size)  # unchanged html
+
+
+class ProfilingTests(BookTestCase):
+
+    def test_profile(self):
+        self.make_plog('cat1', 'first')
+        book = PlogBook(self.location)
+        stat = os.stat
+        profiler = profiling.Profiler()
+        profiler.start()
+        try:
+            book.write_cat_html(os.path.join(self.location, 'cat1'))
+            book.find_plogs(silent=True)
+        finally:
+            profiler.stop()
+        self.assertIs(os.stat, stat)
+        report = profiler.report()
+        self.assertEqual(report['phases']['category_pages']['calls'], 1)
+        self.assertGreater(report['phases']['category_pages']['bytes_written'], 0)
+        self.assertGreater(report['phases']['find_plogs']['files_stated'], 0)
+        self.assertIs(profiling.phase('disabled'), profiling.phase('disabled'))  # no-op when not profiling
+
 
 def main():
     unittest.main()
@@ -1,6 +1,171 @@
 """
-Here are various helper functions
+Here are various helper functions.
+Modules that are slow to import and aren't needed by every command are imported on first use.
 """
+import os
+import sys
+import contextlib
+import time
+from datetime import datetime
+
+from plogbook import profiling
+
+try:
+    from os import scandir
+except ImportError:  # python < 3.5
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+class _DirEntry(object):
+    """Stand-in for os.DirEntry on pythons without scandir, stat is done once and only when needed"""
+    __slots__ = ('name', 'path', '_stat')
+
+    def __init__(self, directory, name):
+        self.name = name
+        self.path = os.path.join(directory, name)
+        self._stat = None
+
+    def stat(self):
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+    def is_dir(self):
+        return os.path.isdir(self.path)
+
+    def is_file(self):
+        return os.path.isfile(self.path)
+
+
+def scan_directory(path):
+    """
+    :param path[str] - directory to list
+    :return: list of os.DirEntry like entries, their type comes from the directory listing and stat is cached
+    """
+    if scandir is None:
+        return [_DirEntry(path, name) for name in os.listdir(path)]
+    return list(scandir(path))
+
+
+def fingerprint(string):
+    """
+    :param string[str] - string to fingerprint, i.e. template content
+    :return: short hex digest of the string
+    """
+    import hashlib
+    return hashlib.sha1(string.encode('utf-8')).hexdigest()[:16]
+
+
+@contextlib.contextmanager
+def atomic_file(location, mode='w'):
+    """
+    Opens a temporary file that is renamed over location once it's fully written so content can be streamed to it,
+    readers never see a half written file and location is left as it was if writing fails
+    :param location[str] - file to write
+    :param mode[str] - mode to open the temporary file with
+    """
+    import tempfile
+    directory, name = os.path.split(location)
+    handle, temp_location = tempfile.mkstemp(dir=directory or '.', prefix='.{}.'.format(name), suffix='.tmp')
+    try:
+        with os.fdopen(handle, mode) as temp_file:
+            yield temp_file
+        os.chmod(temp_location, 0o666 & ~_umask())  # mkstemp makes files readable only by the owner
+        getattr(os, 'replace', os.rename)(temp_location, location)
+    except BaseException:
+        if os.path.exists(temp_location):
+            os.remove(temp_location)
+        raise
+
+
+def write_file(location, content):
+    """
+    Writes content through a temporary file renamed over location so readers never see a half written file,
+    a file that already has the same content is left untouched
+    :param location[str] - file to write
+    :param content[str] - content of the file, written as utf-8
+    :return: whether the file was changed
+    """
+    if not isinstance(content, bytes):
+        content = content.encode('utf-8')
+    try:
+        if os.stat(location).st_size == len(content):
+            with open(location, 'rb') as existing:
+                if existing.read() == content:
+                    return False
+    except (IOError, OSError):  # doesn't exist yet
+        pass
+    with atomic_file(location, 'wb') as temp_file:
+        temp_file.write(content)
+    profiling.count('files_changed')
+    profiling.count('bytes_written', len(content))
+    return True
+
+
+def gzip_bytes(content):
+    """
+    :param content[str] - content to compress
+    :return: gzip compressed utf-8 content, same content always compresses to the same bytes
+    """
+    import io
+    import gzip
+    if not isinstance(content, bytes):
+        content = content.encode('utf-8')
+    compressed = io.BytesIO()
+    with gzip.GzipFile(fileobj=compressed, mode='wb', compresslevel=9, mtime=0) as gzip_file:
+        gzip_file.write(content)
+    return compressed.getvalue()
+
+
+_UMASK = []
+
+
+def _umask():
+    if not _UMASK:
+        _UMASK.append(os.umask(0o022))
+        os.umask(_UMASK[0])
+    return _UMASK[0]
+
+
+def quote(string):
+    """
+    :param string[str] - url path to quote
+    :return: quoted url path
+    """
+    if sys.version_info[0] == 3:
+        from urllib.parse import quote as url_quote
+    else:
+        from urllib import quote as url_quote
+    return url_quote(string)
+
+
+def has_module(name):
+    """
+    :param name[str] - name of top level module, i.e. markdown2
+    :return: whether the module can be imported, without importing it
+    """
+    try:
+        from importlib.util import find_spec
+    except ImportError:  # python2
+        from pkgutil import find_loader as find_spec
+    return find_spec(name) is not None
+
+def parse_date(string):
+    """
+    :param string[str] - date in YYYY-MM-DD or "YYYY-MM-DD HH:MM" format
+    :return: timestamp of the date in local time
+    """
+    for date_format in ('%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return time.mktime(datetime.strptime(string, date_format).timetuple())
+        except ValueError:
+            continue
+    raise ValueError('invalid date "{}", expected YYYY-MM-DD or "YYYY-MM-DD HH:MM"'.format(string))
+
+
 def truncate(string, max_length, raw=False, reverse=False):
         """
         :param string[str] - string to truncate
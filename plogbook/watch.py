@@ -0,0 +1,249 @@
+"""
+Watch mode that keeps Plogbook pages, themes and index up to date while plogs and templates are edited by hand.
+Changes are taken from inotify on linux and from mtime snapshots elsewhere, bursts of changes are collected for a
+short while and then only the affected categories and the main page are regenerated.
+"""
+from __future__ import print_function
+import os
+import time
+import fnmatch
+
+from plogbook import utils
+from plogbook.index import INDEX_DIR, DATES_DIR, is_page, is_category
+
+POLL_INTERVAL = 2.0  # seconds between snapshots of the polling watcher
+DEBOUNCE = 0.5  # seconds without changes before a burst of changes is handled
+MAX_DELAY = 5.0  # seconds a continuous burst of changes can delay the update
+
+
+def is_generated(root, name):
+    """Whether top level folder of the Plogbook is written by Plogbook itself, i.e. the index or the date pages"""
+    return name == INDEX_DIR or name == DATES_DIR and not is_category(root, name)
+
+
+def is_watched(root, path, is_dir):
+    """
+    Whether a change of path can affect the pages of the Plogbook
+    :param root: Plogbook location
+    :param path: changed file or directory
+    :param is_dir: whether path is a directory
+    """
+    parent, name = os.path.split(path)
+    if name.startswith('.'):
+        return False
+    if parent == root:  # categories appearing or disappearing, files in the root are written by Plogbook
+        return is_dir and not is_generated(root, name)
+    if parent == os.path.join(root, 'templates'):
+        return not is_dir
+    if os.path.dirname(parent) != root or is_generated(root, os.path.basename(parent)):
+        return False
+    return name == 'theme.css' or (fnmatch.fnmatch(name, '*.html') and not is_page(name))
+
+
+class PollingWatcher:
+    """
+    Finds changes by comparing mtime snapshots of the Plogbook, works everywhere.
+    Idle cost is one directory listing per category and a stat per plog every interval.
+    """
+
+    def __init__(self, location, interval=POLL_INTERVAL):
+        self.location = os.path.abspath(location)
+        self.interval = interval
+        self.snapshot = self._snapshot()
+
+    def _snapshot(self):
+        """
+        :return: dict of {(path, is_dir): mtime} of watched files and directories
+        """
+        snapshot = {}
+        for entry in utils.scan_directory(self.location):
+            if not entry.is_dir() or is_generated(self.location, entry.name):
+                continue
+            snapshot[(entry.path, True)] = entry.stat().st_mtime
+            for child in utils.scan_directory(entry.path):
+                if not child.is_dir() and is_watched(self.location, child.path, False):
+                    snapshot[(child.path, False)] = child.stat().st_mtime
+        return snapshot
+
+    def changes(self, timeout=None):
+        """
+        Waits for changes
+        :param timeout: seconds to wait, None to wait for the polling interval
+        :return: set of (path, is_dir) tuples that were created, modified or removed
+        """
+        time.sleep(self.interval if timeout is None else timeout)
+        snapshot = self._snapshot()
+        changed = set(key for key, mtime in snapshot.items() if self.snapshot.get(key) != mtime)
+        changed.update(key for key in self.snapshot if key not in snapshot)
+        self.snapshot = snapshot
+        return set((path, is_dir) for path, is_dir in changed if is_watched(self.location, path, is_dir))
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    Finds changes through linux inotify, the process sleeps in select() until something changes.
+    The Plogbook root, every top level folder and the templates folder are watched.
+    """
+    # event masks from <sys/inotify.h>
+    IN_MODIFY = 0x2
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+
+    def __init__(self, location):
+        import ctypes
+        import ctypes.util
+        import struct
+        self.location = os.path.abspath(location)
+        self._event = struct.Struct('iIII')
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.watches = {}
+        self._add_watch(self.location)
+        for entry in utils.scan_directory(self.location):
+            if entry.is_dir() and not is_generated(self.location, entry.name):
+                self._add_watch(entry.path)
+
+    def _add_watch(self, path):
+        descriptor = self._libc.inotify_add_watch(self.fd, path.encode('utf-8'), self.MASK)
+        if descriptor >= 0:
+            self.watches[descriptor] = path
+
+    def changes(self, timeout=None):
+        """
+        Waits for changes
+        :param timeout: seconds to wait, None to wait until something changes
+        :return: set of (path, is_dir) tuples that were created, modified or removed, everything in the Plogbook if
+        events were lost
+        """
+        import select
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except OSError:  # EAGAIN, no more events
+                break
+            offset = 0
+            while offset < len(data):
+                descriptor, mask, _, length = self._event.unpack_from(data, offset)
+                offset += self._event.size
+                name = data[offset:offset + length].rstrip(b'\0').decode('utf-8', 'replace')
+                offset += length
+                if mask & self.IN_Q_OVERFLOW:
+                    changed.update(PollingWatcher(self.location, 0).snapshot)
+                    continue
+                if mask & self.IN_IGNORED:
+                    self.watches.pop(descriptor, None)
+                    continue
+                parent = self.watches.get(descriptor)
+                if parent is None or not name:
+                    continue
+                path = os.path.join(parent, name)
+                is_dir = bool(mask & self.IN_ISDIR)
+                if is_dir and parent == self.location and mask & (self.IN_CREATE | self.IN_MOVED_TO) \
+                        and not is_generated(self.location, name):
+                    self._add_watch(path)
+                changed.add((path, is_dir))
+        return set((path, is_dir) for path, is_dir in changed if is_watched(self.location, path, is_dir))
+
+    def close(self):
+        os.close(self.fd)
+
+
+def make_watcher(location, polling=False):
+    """
+    :param polling: use the polling watcher even if inotify is available
+    :return: InotifyWatcher if inotify is available, otherwise PollingWatcher
+    """
+    if not polling:
+        try:
+            return InotifyWatcher(location)
+        except (OSError, AttributeError):  # not linux or no inotify in libc
+            pass
+    return PollingWatcher(location)
+
+
+def update(book, changes):
+    """
+    Regenerates what the changes affect: themes, pages of changed categories and the main page
+    :param book: PlogBook being watched
+    :param changes: set of (path, is_dir) tuples
+    :return: list of names of regenerated categories
+    """
+    root = book.index.location
+    templates = set(os.path.basename(path) for path, _ in changes
+                    if os.path.dirname(path) == os.path.join(root, 'templates'))
+    known = set(name for name, _, _, _ in book.index.categories())
+    rescan = set()
+    for path, is_dir in changes:
+        parent, name = os.path.split(path)
+        if is_dir or parent == root or name in templates:
+            continue
+        category = os.path.basename(parent)
+        if name != 'theme.css' or category not in known or not os.path.exists(path):
+            rescan.add(category)
+    changed = book.index.reindex(rescan=rescan)
+    if templates:  # pages link the theme by it's hash so every page has to be regenerated for any template
+        book.reload_templates()
+        changed = [name for name, _, _, _ in book.index.categories()]
+    categories = [name for name in changed if os.path.isdir(os.path.join(root, name))]
+    if 'theme.css' in templates:
+        book.write_theme()
+    for name in categories:
+        location = os.path.join(root, name)
+        if 'theme.css' in templates and book.legacy_theme:
+            book.write_theme(location)
+        book.write_cat_html(location)
+        book.index.touch_category(name)
+    if changed or templates:
+        book.write_main_html()
+        book.write_date_pages()
+        book.write_feed()
+    return categories
+
+
+def watch(book, polling=False, debounce=DEBOUNCE):
+    """
+    Keeps the Plogbook up to date until interrupted
+    :param book: PlogBook to watch
+    :param polling: use mtime snapshots instead of inotify
+    :param debounce: seconds without changes before they are handled
+    """
+    book.index.reindex()
+    watcher = make_watcher(book.location, polling)
+    print('watching {} for changes ({}), press Ctrl+C to stop'.format(
+        book.location, 'inotify' if isinstance(watcher, InotifyWatcher) else 'polling'))
+    try:
+        while True:
+            changes = watcher.changes()
+            if not changes:
+                continue
+            started = time.time()
+            while time.time() - started < MAX_DELAY:
+                more = watcher.changes(debounce)
+                if not more:
+                    break
+                changes |= more
+            categories = update(book, changes)
+            print('{} updated {} categories{}'.format(time.strftime('%X'), len(categories),
+                                                     ': ' + ', '.join(sorted(categories)) if categories else ''))
+    except KeyboardInterrupt:
+        print('stopped watching')
+    finally:
+        watcher.close()